@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# "auto" turns the cache on only when a configured backend already loads the query
+# encoder it embeds with (see assistant.py); "true"/"false" force it on or off
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "auto").lower()
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 2000))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600))
+# JSONL file the cache is persisted to (relative paths are taken from the repository
+# root); empty keeps it in memory only
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "")
+if ANSWER_CACHE_PATH:
+    ANSWER_CACHE_PATH = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "..", os.path.expanduser(ANSWER_CACHE_PATH),
+    )
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+class SemanticAnswerCache:
+    """
+    Cache of answer payloads, looked up by query embedding similarity.
+
+    Entries are grouped by key (e.g. (city, model_choice, search_type)). A lookup
+    returns the closest entry under the same key if its cosine similarity is at
+    least `threshold` and it was stored for the same index `version`; entries from
+    another version are dropped on sight. Entries expire after `ttl` seconds and the
+    least recently used ones are evicted beyond `max_entries`.
+
+    Payloads may carry the `conversation_id` they were answered in; set_relevance
+    attaches the judge's verdict to them later, so cache hits can reuse it.
+
+    With `path` set, every insert and verdict is appended to a JSONL log that is
+    replayed on start-up and compacted once it holds twice as many lines as live entries.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 ttl=ANSWER_CACHE_TTL, path=ANSWER_CACHE_PATH):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path or None
+
+        self._entries = OrderedDict()  # entry id -> entry, least recently used first
+        self._buckets = {}  # key -> [entry id]
+        self._next_id = 0
+        self._log_lines = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        if self.path:
+            self._load()
+
+    def _expired(self, entry, now):
+        return self.ttl > 0 and now - entry["created"] > self.ttl
+
+    def _add(self, key, version, embedding, payload, created):
+        entry_id = self._next_id
+        self._next_id += 1
+        self._entries[entry_id] = {
+            "key": key,
+            "version": version,
+            "embedding": embedding,
+            "payload": payload,
+            "created": created,
+        }
+        self._buckets.setdefault(key, []).append(entry_id)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets[entry["key"]]
+        bucket.remove(entry_id)
+        if not bucket:
+            del self._buckets[entry["key"]]
+
+    def get(self, key, embedding, version=None):
+        """Return (payload, similarity) of the best match, or (None, best similarity)."""
+        query = _unit(embedding)
+        now = time.time()
+        with self._lock:
+            candidates = []
+            for entry_id in list(self._buckets.get(key, [])):
+                entry = self._entries[entry_id]
+                if entry["version"] != version or self._expired(entry, now):
+                    self._remove(entry_id)
+                else:
+                    candidates.append(entry_id)
+
+            best_id, best_similarity = None, 0.0
+            if candidates:
+                matrix = np.stack([self._entries[entry_id]["embedding"] for entry_id in candidates])
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+                best_id, best_similarity = candidates[best], float(similarities[best])
+
+            if best_id is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None, best_similarity
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id]["payload"], best_similarity
+
+    def put(self, key, embedding, payload, version=None):
+        embedding = _unit(embedding)
+        created = time.time()
+        with self._lock:
+            self._add(key, version, embedding, payload, created)
+            if self.path:
+                self._append({
+                    "key": list(key),
+                    "version": version,
+                    "embedding": embedding.tolist(),
+                    "payload": payload,
+                    "created": created,
+                })
+
+    def _set_relevance(self, conversation_id, relevance, explanation):
+        found = False
+        for entry in self._entries.values():
+            if entry["payload"].get("conversation_id") == conversation_id:
+                entry["payload"]["relevance"] = relevance
+                entry["payload"]["relevance_explanation"] = explanation
+                found = True
+        return found
+
+    def set_relevance(self, conversation_id, relevance, explanation):
+        """Store the verdict for the entries answered in `conversation_id`. Returns False if there are none."""
+        with self._lock:
+            found = self._set_relevance(conversation_id, relevance, explanation)
+            if found and self.path:
+                self._append({
+                    "conversation_id": conversation_id,
+                    "relevance": relevance,
+                    "relevance_explanation": explanation,
+                })
+            return found
+
+    def invalidate(self, predicate=None):
+        """Drop every entry, or those whose key satisfies `predicate(key)`."""
+        with self._lock:
+            for entry_id in [i for i, e in self._entries.items() if predicate is None or predicate(e["key"])]:
+                self._remove(entry_id)
+            if self.path:
+                self._compact()
+
+    def _append(self, record):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            self._log_lines += 1
+            if self._log_lines > 2 * max(len(self._entries), 1) and self._log_lines > 100:
+                self._compact()
+        except (OSError, TypeError) as e:
+            print(f"Could not persist answer cache entry: {e}")
+
+    def _compact(self):
+        """Rewrite the log with only the live entries."""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in self._entries.values():
+                    f.write(json.dumps({
+                        "key": list(entry["key"]),
+                        "version": entry["version"],
+                        "embedding": entry["embedding"].tolist(),
+                        "payload": entry["payload"],
+                        "created": entry["created"],
+                    }) + "\n")
+            os.replace(tmp_path, self.path)
+            self._log_lines = len(self._entries)
+        except (OSError, TypeError) as e:
+            print(f"Could not compact answer cache: {e}")
+
+    def _load(self):
+        now = time.time()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    self._log_lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:  # torn last line after a crash
+                        continue
+                    if "key" not in record:  # a verdict for an earlier entry
+                        self._set_relevance(record["conversation_id"], record["relevance"],
+                                            record["relevance_explanation"])
+                        continue
+                    if self._expired(record, now):
+                        continue
+                    self._add(tuple(record["key"]), record["version"],
+                              _unit(record["embedding"]), record["payload"], record["created"])
+        except OSError:
+            return
+        print(f"Answer cache loaded {len(self._entries)} entries from {self.path}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
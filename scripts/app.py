@@ -1,8 +1,9 @@
 import streamlit as st
 import time
 import uuid
-from assistant import get_answer
-from db import save_conversation, save_feedback, get_recent_conversations, get_feedback_stats
+from assistant import get_answer_stream, relevance_judge, SEARCH_TYPES
+from db import save_conversation, save_feedback, get_recent_conversations, get_feedback_stats, save_spans
+from tracing import Trace, start_metrics_server
 
 # ---------------------------
 # Utility
@@ -31,7 +32,7 @@ def main():
     model_choice = st.sidebar.selectbox("🤖 Choose Model:", ["mistral-medium-2508", "ministral-8b-latest", "mistral-small-latest"])
     print_log(f"User selected model: {model_choice}")
     
-    search_type = st.sidebar.radio("🔍 Search Type:", ["Qdrant", "Elasticsearch_Text", "Elasticsearch_Vector", "MinSearch"])
+    search_type = st.sidebar.radio("🔍 Search Type:", SEARCH_TYPES)
     print_log(f"User selected search type: {search_type}")
 
     st.sidebar.markdown("---")
@@ -62,24 +63,43 @@ def main():
             with st.spinner("Thinking... ✈️"):
                 print_log(f"Getting answer from assistant using {model_choice} model and {search_type} search")
                 start_time = time.time()
-                answer_data = get_answer(user_input, city, model_choice, search_type)
-                end_time = time.time()
-                print_log(f"Answer received in {end_time - start_time:.2f} seconds")
+                trace = Trace()
+                # Every question gets its own id; the feedback buttons rate the latest one
+                st.session_state.conversation_id = str(uuid.uuid4())
+                answer_chunks, answer_data = get_answer_stream(
+                    user_input, city, model_choice, search_type, trace, st.session_state.conversation_id)
+
+            # Render tokens as they arrive; answer_data is complete once the stream ends
+            st.write_stream(answer_chunks)
+            end_time = time.time()
+            print_log(f"Answer received in {end_time - start_time:.2f} seconds")
+            if answer_data:
                 st.success("Completed!")
-                st.write(answer_data["answer"])
 
                 # Display monitoring info
                 st.write(f"Response time: {answer_data['response_time']:.2f} seconds")
+                st.write(f"Time to first token: {answer_data['time_to_first_token']:.2f} seconds")
+                if answer_data['tokens_per_second'] is not None:
+                    st.write(f"Tokens/sec: {answer_data['tokens_per_second']:.1f}")
                 st.write(f"Relevance: {answer_data['relevance']}")
                 st.write(f"Model used: {answer_data['model_used']}")
                 st.write(f"Total tokens: {answer_data['total_tokens']}")
                 st.write(f"Search Method: {answer_data['search_type']}")
+                if answer_data['cached']:
+                    st.caption("⚡ Served from the answer cache")
 
                 # Save conversation
                 print_log("Saving conversation to database")
-                save_conversation(st.session_state.conversation_id, user_input, answer_data, city)
+                with trace.span("save"):
+                    save_conversation(st.session_state.conversation_id, user_input, answer_data, city)
+                save_spans(st.session_state.conversation_id, trace.spans)
                 print_log("Conversation saved successfully")
 
+                # Relevance is judged in the background and written back to the saved row;
+                # cached answers come with their original verdict
+                if answer_data['relevance'] == "PENDING":
+                    relevance_judge.submit(st.session_state.conversation_id, user_input, answer_data["answer"])
+
         # Feedback buttons
         col1, col2 = st.columns(2)
         with col1:
@@ -106,7 +126,8 @@ def main():
     # RIGHT COLUMN
     # =====================
     with right_col:
-        # Feedback stats
+        # Both panels are served from db's read cache between writes, so widget
+        # reruns do not query Postgres (see POSTGRES_READ_CACHE_TTL)
         feedback_stats = get_feedback_stats()
         st.subheader("📊 Feedback Stats")
         st.metric("👍 Thumbs Up", feedback_stats['thumbs_up'])
@@ -134,4 +155,6 @@ print_log("Streamlit app loop completed")
 
 if __name__ == "__main__":
     print_log("Travel Assistant application started")
+    # Stage latency histograms for Prometheus (no-op without prometheus_client)
+    start_metrics_server()
     main()
@@ -1,177 +1,33 @@
 import os
 import time
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from mistralai import Mistral
 from mistralai.models import UserMessage
 from dotenv import load_dotenv
 
-from elasticsearch import Elasticsearch
-from sentence_transformers import SentenceTransformer
-
-from minsearch_client import minsearch_index as index
-
-from qdrant_client import QdrantClient, models
+from retrievers import (
+    get_retriever, available_retrievers, get_query_encoder, index_version,
+    QUERY_ENCODER_BACKENDS, SEARCH_TIMEOUT,
+)
+from answer_cache import SemanticAnswerCache, ANSWER_CACHE_ENABLED
+from relevance_judge import RelevanceJudge
+from db import update_relevance, save_spans
+from tracing import Trace, observe
 
 
 # os.environ["SSL_CERT_FILE"] = "/mnt/d/Travel Assistant/Musafir/Fortinet_CA_SSL(15).cer"
 # os.environ["REQUESTS_CA_BUNDLE"] = "/mnt/d/Travel Assistant/Musafir/Fortinet_CA_SSL(15).cer"
 
-ELASTIC_URL = os.getenv("ELASTIC_URL_LOCAL", "http://localhost:9200")
-es_client = Elasticsearch(ELASTIC_URL)
-print(es_client)
-
-model = SentenceTransformer("multi-qa-distilbert-cos-v1")
-
 load_dotenv()  
 api_key = os.getenv("API_KEY")
 llm_client = Mistral(api_key = api_key)
 
-# Elasticsearch Text
-
-def elastic_search_filter(query, city, index_name="traveller_vector"):
-    
-    search_query = {
-        "size": 5,
-        "query": {
-            "bool": {
-                "must": [
-                    {
-                        "multi_match": {
-                            "query": query,
-                            "fields": ['city', 'section', 'subsection', 'text'],
-                            "type": "best_fields"
-                        }
-                    }
-                ]
-            }
-        }
-    }
-
-    # Add filter 
-    if city:
-        search_query["query"]["bool"]["filter"] = {
-            "term": {
-                "city": city
-            }
-        }
-
-
-    response = es_client.search(index=index_name, body=search_query)
-    
-    result_docs = []
-
-    for hit in response['hits']['hits']:
-        result_docs.append(hit['_source'])     
-    
-    return result_docs
-
-# Elasticsearch Vector
-def elastic_search_hybrid(field, query, vector, city, index_name_vec="traveller_vector"):
-    knn_query = {
-        "field": field,
-        "query_vector": vector,
-        "k": 5,
-        "num_candidates": 10000,
-        "boost": 0.5,
-        "filter": {
-            "term": {
-                "city": city
-            }
-        }
-    }
-
-    keyword_query = {
-        "bool": {
-            "must": {
-                "multi_match": {
-                    "query": query,
-                    "fields": ["city^3", 'section', 'subsection', 'text'],
-                    "type": "best_fields",
-                    "boost": 0.5,
-                }
-            },
-            "filter": {
-                "term": {
-                    "city": city
-                }
-            }
-        }
-    }
-
-    search_query = {
-        "knn": knn_query,
-        "query": keyword_query,
-        "size": 5,
-        "_source": ["city", 'section', 'subsection', 'text', "id"]
-    }
-
-    es_results = es_client.search(
-        index=index_name_vec,
-        body=search_query
-    )
-    
-    result_docs = []
-    
-    for hit in es_results['hits']['hits']:
-        result_docs.append(hit['_source'])
-
-    return result_docs
-
-#Minsearch
-def minsearch_search_filter(query, city):
-    boost = {'text': 3.0, 'section': 0.5}
-    results = index.search(
-        query=query,
-        filter_dict={'city': city},
-        boost_dict=boost,
-        num_results=5
-    )
-    return results
-
-QDRANT_URL = os.getenv("QDRANT_URL")
-qdrant_client = QdrantClient(url=QDRANT_URL)
-QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME")
-MODEL_HANDLE = os.getenv("MODEL_HANDLE")
-
-#Qdrant
-def qdrant_rrf_search(query: str, city: str, limit: int = 5) -> list[models.ScoredPoint]:
-    results = qdrant_client.query_points(
-        collection_name=QDRANT_COLLECTION_NAME,
-        prefetch=[
-            models.Prefetch(
-                query=models.Document(
-                    text=query,
-                    model=MODEL_HANDLE,
-                ),
-                using="jina-small",
-                limit=(5 * limit),
-            ),
-            models.Prefetch(
-                query=models.Document(
-                    text=query,
-                    model="Qdrant/bm25",
-                ),
-                using="bm25",
-                limit=(5 * limit),
-            ),
-        ],
-        query_filter=models.Filter(
-            must=[
-                models.FieldCondition(
-                    key="city",
-                    match=models.MatchValue(value=city)
-                )
-            ]
-        ),
-        query=models.FusionQuery(fusion=models.Fusion.RRF),
-        with_payload=True,
-        limit=limit,  # final number of results returned
-    )
-
-    return [
-    point.payload for point in results.points
-]
+# Search backends (clients, models and indexes) are built on first use by the
+# registry in retrievers.py, so importing this module stays cheap.
+SEARCH_TYPES = available_retrievers() + ["Ensemble"]
 
 # RAG Flow
 def build_prompt(query, search_results):
@@ -199,21 +55,35 @@ CONTEXT:
     return prompt
 
 
-def llm(prompt, model_choice):
-    start_time = time.time()
+JUDGE_MODEL = "open-mixtral-8x7b"
+
+# Supported Mistral models
+MISTRAL_MODELS = [
+    "mistral-medium-2508",
+    "ministral-8b-latest",
+    "mistral-small-latest",
+    "open-mixtral-8x7b"
+]
 
-    # Supported Mistral models
-    mistral_models = [
-        "mistral-medium-2508",
-        "ministral-8b-latest",
-        "mistral-small-latest",
-        "open-mixtral-8x7b"
-   
-    ]
 
+def _check_model(model_choice):
     # Check if user-selected model is valid
-    if model_choice not in mistral_models:
-        raise ValueError(f"Unknown model choice: {model_choice}. Available models: {mistral_models}")
+    if model_choice not in MISTRAL_MODELS:
+        raise ValueError(f"Unknown model choice: {model_choice}. Available models: {MISTRAL_MODELS}")
+
+
+def _token_info(usage):
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "total_tokens": getattr(usage, "total_tokens", None),
+    }
+
+
+def llm(prompt, model_choice):
+    start_time = time.time()
+
+    _check_model(model_choice)
 
     # Call the chosen Mistral model
     response = llm_client.chat.complete(
@@ -224,18 +94,68 @@ def llm(prompt, model_choice):
     answer = response.choices[0].message.content
 
     # Extract token usage (if available)
-    tokens = getattr(response, "usage", None)
-    token_info = {
-        "prompt_tokens": getattr(tokens, "prompt_tokens", None),
-        "completion_tokens": getattr(tokens, "completion_tokens", None),
-        "total_tokens": getattr(tokens, "total_tokens", None),
-    }
+    token_info = _token_info(getattr(response, "usage", None))
 
     elapsed_time = round(time.time() - start_time, 2)
 
     return answer, token_info, elapsed_time
 
 
+def _delta_text(content):
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(getattr(part, "text", "") or "" for part in content)
+    return ""
+
+
+def llm_stream(prompt, model_choice, metrics):
+    """Stream the answer from the chosen Mistral model, yielding text chunks.
+
+    Once the stream is exhausted, `metrics` holds 'answer', 'tokens',
+    'response_time', 'time_to_first_token' and 'tokens_per_second'.
+    """
+    _check_model(model_choice)
+
+    start_time = time.time()
+    first_token_time = None
+    usage = None
+    parts = []
+
+    for event in llm_client.chat.stream(
+        model=model_choice,
+        messages=[UserMessage(content=prompt)],
+    ):
+        chunk = event.data
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        if not chunk.choices:
+            continue
+        text = _delta_text(chunk.choices[0].delta.content)
+        if not text:
+            continue
+        if first_token_time is None:
+            first_token_time = time.time()
+        parts.append(text)
+        yield text
+
+    end_time = time.time()
+    token_info = _token_info(usage)
+    completion_tokens = token_info["completion_tokens"]
+    ttft = (first_token_time or end_time) - start_time
+    generation_time = end_time - (first_token_time or start_time)
+    # Stream chunks are not tokens: without usage from the provider the rate is unknown
+    tokens_per_second = round(completion_tokens / generation_time, 2) \
+        if completion_tokens and generation_time > 0 else None
+
+    metrics.update({
+        "answer": "".join(parts),
+        "tokens": token_info,
+        "response_time": round(end_time - start_time, 2),
+        "time_to_first_token": round(ttft, 3),
+        "tokens_per_second": tokens_per_second,
+    })
+
 
 def evaluate_relevance(question, answer):
     prompt_template = """
@@ -259,7 +179,7 @@ it as "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT".
     """.strip()
 
     prompt = prompt_template.format(question=question, answer=answer)
-    evaluation, tokens, _ = llm(prompt, 'open-mixtral-8x7b')
+    evaluation, tokens, _ = llm(prompt, JUDGE_MODEL)
     
     try:
         json_eval = json.loads(evaluation)
@@ -269,27 +189,121 @@ it as "NON_RELEVANT", "PARTLY_RELEVANT", or "RELEVANT".
 
 
 
-def get_answer(query, city, model_choice, search_type):
-    if search_type == 'Elasticsearch_Vector':
-        vector = model.encode(query)
-        search_results = elastic_search_hybrid("all_data_vector", query, vector, city) 
-    elif search_type == 'Elasticsearch_Text':
-        search_results = elastic_search_filter(query, city)
-    elif search_type == "Qdrant":
-        search_results = qdrant_rrf_search(query, city)
-    else:
-        search_type == "MinSearch"
-        search_results = minsearch_search_filter(query, city)
+def _save_judge_span(conversation_id, seconds):
+    trace = Trace()
+    trace.add("judge", seconds, JUDGE_MODEL)
+    save_spans(conversation_id, trace.spans)
 
-    prompt = build_prompt(query, search_results)
-    answer, tokens, response_time = llm(prompt, model_choice)
-    
-    relevance, explanation, eval_tokens = evaluate_relevance(query, answer)
 
+def _update_relevance(conversation_id, relevance, explanation, eval_tokens):
+    updated = update_relevance(conversation_id, relevance, explanation, eval_tokens)
+    # Cache hits of this answer reuse the verdict instead of calling the judge again
+    if updated and answer_cache is not None and relevance != "UNKNOWN":
+        answer_cache.set_relevance(conversation_id, relevance, explanation)
+    return updated
 
+
+# Background judging of saved conversations (see get_answer)
+relevance_judge = RelevanceJudge(evaluate_relevance, _update_relevance, span_fn=_save_judge_span)
+
+
+# Ensemble (concurrent retrieval + reciprocal rank fusion)
+ENSEMBLE_BACKENDS = [
+    backend.strip()
+    for backend in os.getenv("ENSEMBLE_BACKENDS", ",".join(available_retrievers())).split(",")
+    if backend.strip()
+]
+ENSEMBLE_TIMEOUT = float(os.getenv("ENSEMBLE_TIMEOUT", 5))
+ENSEMBLE_RRF_K = int(os.getenv("ENSEMBLE_RRF_K", 60))
+# Ensemble requests served at once; the pool has a worker per backend for each of them.
+# Each search is bounded by SEARCH_TIMEOUT (retrievers.py), so a hung backend cannot
+# hold its worker much past the request that started it.
+ENSEMBLE_CONCURRENCY = int(os.getenv("ENSEMBLE_CONCURRENCY", 8))
+ensemble_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ENSEMBLE_WORKERS", ENSEMBLE_CONCURRENCY * max(len(ENSEMBLE_BACKENDS), 1))),
+    thread_name_prefix="ensemble",
+)
+
+
+def rrf_fuse(result_lists, k=ENSEMBLE_RRF_K, limit=5):
+    """Merge ranked result lists with reciprocal rank fusion, deduplicated by doc id."""
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = doc.get('id') or doc.get('text')
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            docs.setdefault(key, doc)
+
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ranked[:limit]]
+
+
+def ensemble_search(query, city, backends=None, timeout=ENSEMBLE_TIMEOUT, limit=5, trace=None):
+    """Query all backends concurrently and fuse whatever answers within the timeout.
+
+    A backend that fails or times out is left out of the fusion instead of failing
+    the request; only if none of them answer is an error raised. Each backend's
+    time is traced as an 'ensemble_retrieval' span; searches that finish after the
+    request gave up only reach the Prometheus histogram, not the (saved) trace.
+    """
+    if backends is None:
+        backends = ENSEMBLE_BACKENDS
+    backends = [backend for backend in backends if backend != "Ensemble"]
+    abandoned = threading.Event()
+
+    def timed_search(backend):
+        start_time = time.perf_counter()
+        try:
+            return get_retriever(backend).search(query, city, timeout=SEARCH_TIMEOUT)
+        finally:
+            seconds = time.perf_counter() - start_time
+            if trace is not None and not abandoned.is_set():
+                trace.add("ensemble_retrieval", seconds, backend)
+            else:
+                observe("ensemble_retrieval", seconds, backend)
+
+    futures = {
+        ensemble_pool.submit(timed_search, backend): backend
+        for backend in backends
+    }
+    done, not_done = wait(futures, timeout=timeout)
+    abandoned.set()
+
+    result_lists = []
+    for future in done:
+        backend = futures[future]
+        try:
+            result_lists.append(future.result())
+        except Exception as e:
+            print(f"Ensemble: {backend} failed: {e}")
+    for future in not_done:
+        future.cancel()
+        print(f"Ensemble: {futures[future]} timed out after {timeout}s")
+
+    if not result_lists:
+        raise RuntimeError(f"Ensemble: no backend answered ({', '.join(backends)})")
+
+    return rrf_fuse(result_lists, limit=limit)
+
+
+def search(query, city, search_type, trace=None):
+    if trace is None:
+        trace = Trace()
+    with trace.span("retrieval", search_type):
+        if search_type == "Ensemble":
+            return ensemble_search(query, city, trace=trace)
+        return get_retriever(search_type).search(query, city)
+
+
+def _answer_data(answer, tokens, response_time, relevance, explanation, eval_tokens,
+                 model_choice, search_type, time_to_first_token=None, tokens_per_second=None,
+                 cached=False):
     return {
         'answer': answer,
         'response_time': response_time,
+        'time_to_first_token': time_to_first_token,
+        'tokens_per_second': tokens_per_second,
         'relevance': relevance,
         'relevance_explanation': explanation,
         'model_used': model_choice,
@@ -299,5 +313,160 @@ def get_answer(query, city, model_choice, search_type):
         'eval_prompt_tokens': eval_tokens['prompt_tokens'],
         'eval_completion_tokens': eval_tokens['completion_tokens'],
         'eval_total_tokens': eval_tokens['total_tokens'],
-        'search_type': search_type
-    }
\ No newline at end of file
+        'search_type': search_type,
+        'cached': cached,
+    }
+
+
+PENDING_EVAL_TOKENS = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+
+def _answer_cache_enabled():
+    # The cache embeds questions with the query encoder (torch); in "auto" mode it is
+    # only used when an enabled backend loads that encoder anyway
+    if ANSWER_CACHE_ENABLED == "auto":
+        return any(backend in QUERY_ENCODER_BACKENDS for backend in available_retrievers())
+    return ANSWER_CACHE_ENABLED in ("1", "true", "yes")
+
+
+# Semantic answer cache: near-duplicate questions for the same city, model and
+# search type reuse a previous answer instead of retrieving and calling the LLM
+answer_cache = SemanticAnswerCache() if _answer_cache_enabled() else None
+
+
+def _index_version(search_type):
+    backends = ENSEMBLE_BACKENDS if search_type == "Ensemble" else [search_type]
+    return "|".join(index_version(backend) for backend in backends)
+
+
+def _cache_lookup(query, city, model_choice, search_type, trace, conversation_id=None):
+    """Return (cached answer_data or None, lookup) where lookup is passed to _cache_store.
+
+    A cached answer keeps the verdict its original conversation got from the judge;
+    it is 'PENDING' only while that verdict is still outstanding.
+    """
+    if answer_cache is None:
+        return None, None
+
+    start_time = time.time()
+    try:
+        key = (city, model_choice, search_type)
+        with trace.span("embed"):
+            embedding = get_query_encoder().encode(query)
+        with trace.span("cache_lookup", search_type):
+            version = _index_version(search_type)
+            payload, similarity = answer_cache.get(key, embedding, version)
+    except Exception as e:
+        print(f"Answer cache lookup failed: {e}")
+        return None, None
+
+    if payload is None:
+        return None, (key, embedding, version, conversation_id)
+
+    elapsed = round(time.time() - start_time, 3)
+    print(f"Answer cache hit (similarity {similarity:.3f}) for '{query}'")
+    relevance = payload.get('relevance', "PENDING")
+    answer_data = _answer_data(
+        payload['answer'], PENDING_EVAL_TOKENS, elapsed, relevance,
+        payload.get('relevance_explanation', "") if relevance != "PENDING" else "", PENDING_EVAL_TOKENS,
+        model_choice, search_type, time_to_first_token=elapsed, cached=True,
+    )
+    return answer_data, None
+
+
+def _cache_store(lookup, answer_data):
+    if lookup is None or not answer_data.get('answer'):
+        return
+    key, embedding, version, conversation_id = lookup
+    answer_cache.put(key, embedding, dict(answer_data, conversation_id=conversation_id), version=version)
+
+
+def get_answer(query, city, model_choice, search_type, judge_inline=False, trace=None,
+               conversation_id=None):
+    """Retrieve, answer and (optionally) judge a question.
+
+    By default the answer is returned without waiting for the relevance judge:
+    relevance is 'PENDING' and the caller hands the saved conversation to
+    `relevance_judge.submit`. Pass judge_inline=True to judge synchronously.
+    Answers served from the semantic cache have 'cached' set and no token usage; they
+    only need judging while their relevance is 'PENDING'. `conversation_id` is the id
+    the answer will be saved under, so the cache can pick up its verdict.
+    Stage timings are added to `trace` (a tracing.Trace) if given.
+    """
+    if trace is None:
+        trace = Trace()
+
+    answer_data, lookup = _cache_lookup(query, city, model_choice, search_type, trace, conversation_id)
+    if answer_data is not None:
+        if judge_inline and answer_data['relevance'] == "PENDING":
+            with trace.span("judge", JUDGE_MODEL):
+                relevance, explanation, eval_tokens = evaluate_relevance(query, answer_data['answer'])
+            answer_data.update(
+                relevance=relevance,
+                relevance_explanation=explanation,
+                eval_prompt_tokens=eval_tokens['prompt_tokens'],
+                eval_completion_tokens=eval_tokens['completion_tokens'],
+                eval_total_tokens=eval_tokens['total_tokens'],
+            )
+        return answer_data
+
+    search_results = search(query, city, search_type, trace)
+
+    with trace.span("prompt"):
+        prompt = build_prompt(query, search_results)
+    with trace.span("llm", model_choice):
+        answer, tokens, response_time = llm(prompt, model_choice)
+
+    if judge_inline:
+        with trace.span("judge", JUDGE_MODEL):
+            relevance, explanation, eval_tokens = evaluate_relevance(query, answer)
+    else:
+        relevance, explanation, eval_tokens = "PENDING", "", PENDING_EVAL_TOKENS
+
+    completion_tokens = tokens['completion_tokens']
+    tokens_per_second = round(completion_tokens / response_time, 2) \
+        if completion_tokens and response_time else None
+
+    answer_data = _answer_data(answer, tokens, response_time, relevance, explanation, eval_tokens,
+                               model_choice, search_type, tokens_per_second=tokens_per_second)
+    _cache_store(lookup, answer_data)
+    return answer_data
+
+
+def get_answer_stream(query, city, model_choice, search_type, trace=None, conversation_id=None):
+    """Streaming variant of get_answer.
+
+    Retrieval runs immediately; the returned generator streams the answer text.
+    The returned answer_data dict is filled in once the generator is exhausted,
+    with relevance left PENDING for the background judge. A cached answer is
+    yielded in one chunk, with the verdict it already has (see get_answer). The 'llm' and 'llm_first_token' spans are added to
+    `trace` when the stream ends.
+    """
+    if trace is None:
+        trace = Trace()
+
+    cached, lookup = _cache_lookup(query, city, model_choice, search_type, trace, conversation_id)
+    if cached is not None:
+        def cached_chunks():
+            yield cached['answer']
+        return cached_chunks(), cached
+
+    search_results = search(query, city, search_type, trace)
+    with trace.span("prompt"):
+        prompt = build_prompt(query, search_results)
+    answer_data = {}
+
+    def chunks():
+        metrics = {}
+        yield from llm_stream(prompt, model_choice, metrics)
+        trace.add("llm_first_token", metrics['time_to_first_token'], model_choice)
+        trace.add("llm", metrics['response_time'], model_choice)
+        answer_data.update(_answer_data(
+            metrics['answer'], metrics['tokens'], metrics['response_time'],
+            "PENDING", "", PENDING_EVAL_TOKENS, model_choice, search_type,
+            time_to_first_token=metrics['time_to_first_token'],
+            tokens_per_second=metrics['tokens_per_second'],
+        ))
+        _cache_store(lookup, answer_data)
+
+    return chunks(), answer_data
@@ -0,0 +1,99 @@
+import os
+import json
+import argparse
+from datetime import datetime
+
+from prep import (
+    ES_ANN_PROFILES, INDEX_NAME, estimate_es_vector_memory_mb, fetch_documents, get_es_profile,
+    index_documents, load_ground_truth, load_model, setup_elasticsearch,
+)
+from retrievers import ElasticsearchVectorRetriever, get_es_client, get_query_encoder
+from benchmark_retrieval import BENCHMARK_DIR, ann_recall, recording, run_benchmark
+
+
+REFERENCE_PROFILE = "exhaustive"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Elasticsearch ANN profiles: hit rate/MRR against the ground truth, "
+                    "recall against the exhaustive profile, latency percentiles, index size and "
+                    "estimated vector RAM. Needs a running cluster; one index is built per profile."
+    )
+    parser.add_argument("--profiles", nargs="+", default=list(ES_ANN_PROFILES), choices=list(ES_ANN_PROFILES))
+    parser.add_argument("--prefix", default=f"{INDEX_NAME or 'traveller_vector'}-profile",
+                        help="one index per profile is built as <prefix>-<profile>")
+    parser.add_argument("--reuse", action="store_true", help="search existing profile indices without rebuilding")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=5, help="results per query (size)")
+    parser.add_argument("--sample", type=int, help="benchmark a random sample of the ground truth")
+    parser.add_argument("--city", help="only questions for this city")
+    parser.add_argument("--output", help="JSON results file (default: data/benchmark/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    # Recall is measured against the exhaustive (num_candidates >= corpus, float) profile
+    profiles = [REFERENCE_PROFILE] + [profile for profile in args.profiles if profile != REFERENCE_PROFILE]
+    documents = fetch_documents()
+    ground_truth = load_ground_truth(city=args.city, sample=args.sample)
+    encoder = get_query_encoder()
+    model = None
+    print(f"Benchmarking {len(ground_truth)} questions on {len(documents)} documents, size={args.limit}")
+
+    results = {}
+    reference = {}
+    for profile in profiles:
+        index_name = f"{args.prefix}-{profile}"
+        print(f"▶ {profile} ({index_name})")
+        try:
+            if args.reuse:
+                es_client = get_es_client()
+            else:
+                if model is None:
+                    model = load_model()
+                es_client = setup_elasticsearch(index_name, profile)
+                # Copies: indexing adds the vector to each document
+                index_documents(es_client, [dict(doc) for doc in documents], model, index_name=index_name)
+                es_client.indices.forcemerge(index=index_name, max_num_segments=1)
+
+            settings = get_es_profile(profile)
+            retriever = ElasticsearchVectorRetriever(es_client, encoder, index_name=index_name,
+                                                     k=settings["k"], num_candidates=settings["num_candidates"])
+            returned = reference if profile == REFERENCE_PROFILE else {}
+            summary = run_benchmark(recording(retriever.search, returned), ground_truth,
+                                    concurrency=args.concurrency, limit=args.limit)
+            store = es_client.indices.stats(index=index_name, metric="store")
+            summary["ann_recall"] = ann_recall(returned, reference)
+            summary["index_size_mb"] = round(
+                store["indices"][index_name]["total"]["store"]["size_in_bytes"] / 2**20, 2)
+            summary["vector_ram_mb"] = estimate_es_vector_memory_mb(profile, len(documents))
+            summary["profile"] = settings
+            results[profile] = summary
+            print(f"  {json.dumps({key: summary[key] for key in ('hit_rate', 'mrr', 'ann_recall', 'latency_ms')})}")
+        except Exception as e:
+            print(f"  {profile} skipped: {e}")
+            results[profile] = {"error": str(e)}
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "questions": len(ground_truth),
+            "documents": len(documents),
+            "limit": args.limit,
+            "concurrency": args.concurrency,
+            "city": args.city,
+            "sample": args.sample,
+            "recall_reference": REFERENCE_PROFILE,
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, "results", f"es-profiles-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import argparse
+from datetime import datetime
+
+from prep import fetch_documents, load_ground_truth
+from retrievers import QdrantRetriever, QDRANT_URL, QDRANT_COLLECTION_NAME
+from benchmark_retrieval import (
+    BENCHMARK_DIR, BENCHMARK_MODEL_HANDLE, ann_recall, recording, run_benchmark,
+)
+
+
+def wait_until_optimized(client, collection_name, timeout=600):
+    """Wait for Qdrant to finish building the HNSW graph and quantized vectors."""
+    from qdrant_client import models
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        info = client.get_collection(collection_name)
+        if info.status == models.CollectionStatus.GREEN:
+            return info
+        time.sleep(1)
+    raise TimeoutError(f"{collection_name} still optimizing after {timeout}s")
+
+
+def main():
+    import qdrant
+    from qdrant_client import QdrantClient, models
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Qdrant collection profiles: hit rate/MRR against the ground truth, "
+                    "recall against exact search, latency percentiles and estimated RAM. Needs a "
+                    "Qdrant server, since embedded Qdrant has no HNSW index or quantization."
+    )
+    parser.add_argument("--profiles", nargs="+", default=list(qdrant.QDRANT_PROFILES),
+                        choices=list(qdrant.QDRANT_PROFILES))
+    parser.add_argument("--prefix", default=f"{QDRANT_COLLECTION_NAME or 'musafir'}-profile",
+                        help="one collection per profile is (re)used as <prefix>-<profile>")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=5, help="results per query (k)")
+    parser.add_argument("--sample", type=int, help="benchmark a random sample of the ground truth")
+    parser.add_argument("--city", help="only questions for this city")
+    parser.add_argument("--output", help="JSON results file (default: data/benchmark/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    documents = fetch_documents()
+    ground_truth = load_ground_truth(city=args.city, sample=args.sample)
+    client = QdrantClient(url=QDRANT_URL, timeout=120.0, check_compatibility=False)
+    print(f"Benchmarking {len(ground_truth)} questions on {len(documents)} documents, k={args.limit}")
+
+    results = {}
+    reference = None
+    for profile in args.profiles:
+        collection_name = f"{args.prefix}-{profile}"
+        print(f"▶ {profile} ({collection_name})")
+        try:
+            qdrant.init_collection(collection_name, client, profile=profile)
+            qdrant.index_documents(documents, collection_name, client)
+            info = wait_until_optimized(client, collection_name)
+
+            if reference is None:
+                # Exact float search is the same on every profile's collection
+                exact = models.SearchParams(exact=True, quantization=models.QuantizationSearchParams(ignore=True))
+                reference = {}
+                exact_retriever = QdrantRetriever(client, collection_name, BENCHMARK_MODEL_HANDLE, exact)
+                run_benchmark(recording(exact_retriever.search, reference), ground_truth, limit=args.limit)
+
+            retriever = QdrantRetriever(client, collection_name, BENCHMARK_MODEL_HANDLE,
+                                        qdrant.search_params(profile))
+            returned = {}
+            summary = run_benchmark(recording(retriever.search, returned), ground_truth,
+                                    concurrency=args.concurrency, limit=args.limit)
+            summary["ann_recall"] = ann_recall(returned, reference)
+            summary["memory"] = qdrant.estimate_memory_mb(profile, documents)
+            summary["indexed_vectors"] = info.indexed_vectors_count
+            summary["profile"] = qdrant.get_profile(profile)
+            results[profile] = summary
+            print(f"  {json.dumps({key: summary[key] for key in ('hit_rate', 'mrr', 'ann_recall', 'latency_ms')})}")
+        except Exception as e:
+            print(f"  {profile} skipped: {e}")
+            results[profile] = {"error": str(e)}
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "questions": len(ground_truth),
+            "documents": len(documents),
+            "limit": args.limit,
+            "concurrency": args.concurrency,
+            "city": args.city,
+            "sample": args.sample,
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, "results", f"qdrant-profiles-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
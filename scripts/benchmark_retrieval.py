@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from prep import fetch_documents, load_ground_truth
+from retrievers import (
+    ElasticsearchTextRetriever, ElasticsearchVectorRetriever, MinSearchRetriever,
+    QdrantRetriever, get_es_client, get_query_encoder,
+)
+
+
+BENCHMARK_DIR = os.getenv(
+    "BENCHMARK_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "benchmark"),
+)
+ES_RECORDINGS_PATH = os.getenv("ES_RECORDINGS_PATH", os.path.join(BENCHMARK_DIR, "es_recordings.json"))
+BENCHMARK_MODEL_HANDLE = os.getenv("MODEL_HANDLE") or "jinaai/jina-embeddings-v2-small-en"
+
+BACKENDS = [
+    "MinSearch", "MinSearch_Batch", "Elasticsearch_Text", "Elasticsearch_Text_Batch",
+    "Elasticsearch_Vector", "Elasticsearch_Vector_Batch", "Qdrant",
+]
+
+
+# ---------------------------
+# Metrics (same definitions as the evaluation notebooks)
+# ---------------------------
+def hit_rate(relevance_total):
+    cnt = 0
+    for line in relevance_total:
+        if True in line:
+            cnt = cnt + 1
+    return cnt / len(relevance_total)
+
+
+def mrr(relevance_total):
+    total_score = 0.0
+    for line in relevance_total:
+        for rank in range(len(line)):
+            if line[rank] == True:
+                total_score = total_score + 1 / (rank + 1)
+    return total_score / len(relevance_total)
+
+
+def summarize(relevance_total, latencies, wall_time, errors=0):
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "queries": len(relevance_total),
+        "errors": errors,
+        "hit_rate": round(hit_rate(relevance_total), 4) if relevance_total else None,
+        "mrr": round(mrr(relevance_total), 4) if relevance_total else None,
+        "latency_ms": {
+            "mean": round(float(latencies_ms.mean()), 3),
+            "p50": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 3),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 3),
+        } if len(latencies_ms) else None,
+        "qps": round(len(latencies) / wall_time, 2) if wall_time > 0 else None,
+        "wall_seconds": round(wall_time, 3),
+    }
+
+
+def run_benchmark(search_fn, ground_truth, concurrency=1, limit=5, warmup=3):
+    """Run `search_fn(question, city, limit)` for every ground truth record.
+
+    Queries are issued from `concurrency` threads; each query's latency is measured
+    individually and QPS is taken over the wall time of the whole run.
+    """
+    for record in ground_truth[:warmup]:
+        search_fn(record["question"], record["city"], limit)
+
+    def one(record):
+        start_time = time.perf_counter()
+        try:
+            results = search_fn(record["question"], record["city"], limit)
+        except Exception as e:
+            return time.perf_counter() - start_time, None, e
+        return time.perf_counter() - start_time, [doc.get("id") == record["id"] for doc in results], None
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, ground_truth))
+    wall_time = time.perf_counter() - start_time
+
+    relevance_total = [relevance for _, relevance, error in outcomes if error is None]
+    latencies = [latency for latency, _, error in outcomes if error is None]
+    errors = [error for _, _, error in outcomes if error is not None]
+    if errors:
+        print(f"  {len(errors)} queries failed, first error: {errors[0]}")
+    return summarize(relevance_total, latencies, wall_time, errors=len(errors))
+
+
+def run_batch_benchmark(search_batch_fn, ground_truth, batch_size=64, limit=5):
+    """Run `search_batch_fn(requests, limit)` on batches of (question, city) requests.
+
+    Per-query latency is the batch time / batch size.
+    """
+    relevance_total = []
+    latencies = []
+    start_time = time.perf_counter()
+    for start in range(0, len(ground_truth), batch_size):
+        batch = ground_truth[start:start + batch_size]
+        batch_start = time.perf_counter()
+        results = search_batch_fn([(record["question"], record["city"]) for record in batch], limit)
+        per_query = (time.perf_counter() - batch_start) / len(batch)
+        for record, docs in zip(batch, results):
+            relevance_total.append([doc.get("id") == record["id"] for doc in docs])
+            latencies.append(per_query)
+    return summarize(relevance_total, latencies, time.perf_counter() - start_time)
+
+
+def recording(search_fn, store):
+    """Wrap `search_fn` to keep the result ids of every (question, city)."""
+    def search(question, city, limit):
+        results = search_fn(question, city, limit)
+        store[(question, city)] = [doc.get("id") for doc in results]
+        return results
+    return search
+
+
+def ann_recall(results, reference):
+    """Mean share of the reference result ids (e.g. from exact search) that were also returned."""
+    scores = []
+    for key, expected in reference.items():
+        if expected and key in results:
+            scores.append(len(set(results[key]) & set(expected)) / len(expected))
+    return round(sum(scores) / len(scores), 4) if scores else None
+
+
+# ---------------------------
+# Elasticsearch stand-in
+# ---------------------------
+class RecordedElasticsearch:
+    """
+    Elasticsearch stand-in that replays recorded `search` responses.
+
+    Requests are keyed by index and body, without the query vector, so replays do
+    not need the embedding model. When `client` is given, requests go to the real
+    cluster and their hits and `took` time are recorded; call save() afterwards.
+    Replays sleep for the recorded `took`, so their latency is the server-side time.
+    """
+
+    def __init__(self, path=ES_RECORDINGS_PATH, client=None):
+        self.path = path
+        self.client = client
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.recordings = json.load(f)
+        except (OSError, ValueError):
+            self.recordings = {}
+
+    @staticmethod
+    def request_key(index, body):
+        body = json.loads(json.dumps(body, default=lambda value: value.tolist()))
+        if "knn" in body:
+            body["knn"].pop("query_vector", None)
+        payload = json.dumps({"index": index, "body": body}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _record(self, key, response):
+        with self._lock:
+            self.recordings[key] = {
+                "took": response.get("took", 0),
+                "hits": {"hits": [{"_source": hit["_source"]} for hit in response["hits"]["hits"]]},
+            }
+
+    def _replay(self, key):
+        recorded = self.recordings.get(key)
+        if recorded is None:
+            raise KeyError("no recorded response for this request, run with --record against a live cluster")
+        return recorded
+
+    def search(self, index, body):
+        key = self.request_key(index, body)
+        if self.client is not None:
+            response = self.client.search(index=index, body=body)
+            response = getattr(response, "body", response)
+            self._record(key, response)
+            return response
+
+        recorded = self._replay(key)
+        time.sleep(recorded["took"] / 1000)
+        return recorded
+
+    def options(self, **kwargs):
+        """Per-request options such as timeouts; recording uses the live client's defaults."""
+        return self
+
+    def msearch(self, searches):
+        """Same recordings as search(); a replayed batch takes as long as its slowest search."""
+        keys = [self.request_key(header["index"], body) for header, body in zip(searches[::2], searches[1::2])]
+        if self.client is not None:
+            response = self.client.msearch(searches=searches)
+            response = getattr(response, "body", response)
+            for key, item in zip(keys, response["responses"]):
+                if "error" not in item:
+                    self._record(key, item)
+            return response
+
+        responses = [self._replay(key) for key in keys]
+        if responses:
+            time.sleep(max(recorded["took"] for recorded in responses) / 1000)
+        return {"responses": responses}
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.recordings, f)
+        os.replace(tmp_path, self.path)
+        print(f"Saved {len(self.recordings)} Elasticsearch recordings to {self.path}")
+
+
+class _NoVector:
+    """Replays are keyed without the query vector, so no embedding model is needed."""
+
+    def encode(self, query):
+        return []
+
+    def encode_batch(self, queries):
+        return [[] for _ in queries]
+
+
+# ---------------------------
+# Embedded Qdrant
+# ---------------------------
+def build_embedded_qdrant(documents, collection_name="benchmark", path=None):
+    """Index the documents into an in-process Qdrant (in memory, or on disk at `path`)."""
+    from qdrant_client import QdrantClient
+    import qdrant
+
+    client = QdrantClient(path=path) if path else QdrantClient(":memory:")
+    if not client.collection_exists(collection_name) or \
+            client.count(collection_name).count != len(documents):
+        qdrant.init_collection(collection_name, client)
+        qdrant.index_documents(documents, collection_name, client)
+    return client
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline retrieval benchmark: hit rate, MRR, latency percentiles and QPS per backend. "
+                    "Elasticsearch is replayed from recorded responses (record them once with --record) "
+                    "and Qdrant runs embedded, so no server is needed."
+    )
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=5, help="results per query (k)")
+    parser.add_argument("--sample", type=int, help="benchmark a random sample of the ground truth")
+    parser.add_argument("--city", help="only questions for this city")
+    parser.add_argument("--batch-size", type=int, default=64, help="batch size of the *_Batch backends")
+    parser.add_argument("--record", action="store_true",
+                        help="query the live Elasticsearch cluster and record its responses")
+    parser.add_argument("--qdrant-path", help="keep the embedded Qdrant on disk here between runs")
+    parser.add_argument("--output", help="JSON results file (default: data/benchmark/results/<timestamp>.json)")
+    args = parser.parse_args()
+
+    ground_truth = load_ground_truth(city=args.city, sample=args.sample)
+    print(f"Benchmarking {len(ground_truth)} questions, k={args.limit}, concurrency={args.concurrency}")
+
+    documents = None
+    es = None
+    results = {}
+    for backend in args.backends:
+        print(f"▶ {backend}")
+        try:
+            if backend in ("MinSearch", "MinSearch_Batch"):
+                from minsearch_client import build_minsearch_index
+                if documents is None:
+                    documents = fetch_documents()
+                retriever = MinSearchRetriever(build_minsearch_index(documents))
+            elif backend.startswith("Elasticsearch"):
+                if es is None:
+                    es = RecordedElasticsearch(client=get_es_client() if args.record else None)
+                if backend.startswith("Elasticsearch_Text"):
+                    retriever = ElasticsearchTextRetriever(es)
+                else:
+                    encoder = get_query_encoder() if args.record else _NoVector()
+                    retriever = ElasticsearchVectorRetriever(es, encoder)
+            else:
+                if documents is None:
+                    documents = fetch_documents()
+                client = build_embedded_qdrant(documents, path=args.qdrant_path)
+                retriever = QdrantRetriever(client, collection_name="benchmark",
+                                            model_handle=BENCHMARK_MODEL_HANDLE)
+
+            if backend.endswith("_Batch"):
+                results[backend] = run_batch_benchmark(
+                    retriever.search_batch, ground_truth, batch_size=args.batch_size, limit=args.limit)
+            else:
+                results[backend] = run_benchmark(
+                    retriever.search, ground_truth, concurrency=args.concurrency, limit=args.limit)
+            print(f"  {json.dumps(results[backend])}")
+        except Exception as e:
+            print(f"  {backend} skipped: {e}")
+            results[backend] = {"error": str(e)}
+
+    if es is not None and args.record:
+        es.save()
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "questions": len(ground_truth),
+            "limit": args.limit,
+            "concurrency": args.concurrency,
+            "city": args.city,
+            "sample": args.sample,
+            "es_mode": "record" if args.record else "replay",
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        BENCHMARK_DIR, "results", f"retrieval-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ import random
 import uuid
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
-from db import save_conversation, save_feedback
+from db import save_conversation, save_feedback, WriteBuffer
 
 # Timezone
 tz = ZoneInfo("Africa/Cairo")
@@ -46,44 +46,46 @@ def generate_synthetic_data(start_time, end_time):
     conversation_count = 0
     print(f"🌍 Generating historical travel data from {start_time} to {end_time}...")
 
-    while current_time < end_time:
-        conversation_id = str(uuid.uuid4())
-        city = random.choice(CITIES)
-        question = random.choice(QUESTIONS).format(city)
-        answer = random.choice(ANSWERS)
-        model = random.choice(MODELS)
-        relevance = random.choice(RELEVANCE)
-        search_type = random.choice(SEARCH_TYPES)
-
-        answer_data = {
-            "answer": answer,
-            "response_time": random.uniform(0.5, 5.0),
-            "relevance": relevance,
-            "relevance_explanation": f"This answer is {relevance.lower()} for the user query.",
-            "model_used": model,
-            "search_type": search_type,
-            "prompt_tokens": random.randint(50, 200),
-            "completion_tokens": random.randint(50, 300),
-            "total_tokens": random.randint(100, 500),
-            "eval_prompt_tokens": random.randint(50, 150),
-            "eval_completion_tokens": random.randint(20, 100),
-            "eval_total_tokens": random.randint(70, 250),
-        }
-
-        save_conversation(conversation_id, question, answer_data, city, current_time)
-        print(f"💾 Saved conversation ({city}, {model}, {search_type}, {relevance}) at {current_time}")
-
-        # 70% of conversations get feedback
-        if random.random() < 0.7:
-            feedback = 1 if random.random() < 0.8 else -1
-            save_feedback(conversation_id, feedback, current_time)
-            print(f"📝 Feedback recorded ({'👍' if feedback > 0 else '👎'})")
-
-        current_time += timedelta(minutes=random.randint(3, 15))
-        conversation_count += 1
-
-        if conversation_count % 10 == 0:
-            print(f"Generated {conversation_count} conversations...")
+    # Rows are written in bulk by the buffer instead of one connection per row
+    with WriteBuffer() as buffer:
+        while current_time < end_time:
+            conversation_id = str(uuid.uuid4())
+            city = random.choice(CITIES)
+            question = random.choice(QUESTIONS).format(city)
+            answer = random.choice(ANSWERS)
+            model = random.choice(MODELS)
+            relevance = random.choice(RELEVANCE)
+            search_type = random.choice(SEARCH_TYPES)
+
+            answer_data = {
+                "answer": answer,
+                "response_time": random.uniform(0.5, 5.0),
+                "relevance": relevance,
+                "relevance_explanation": f"This answer is {relevance.lower()} for the user query.",
+                "model_used": model,
+                "search_type": search_type,
+                "prompt_tokens": random.randint(50, 200),
+                "completion_tokens": random.randint(50, 300),
+                "total_tokens": random.randint(100, 500),
+                "eval_prompt_tokens": random.randint(50, 150),
+                "eval_completion_tokens": random.randint(20, 100),
+                "eval_total_tokens": random.randint(70, 250),
+            }
+
+            buffer.add_conversation(conversation_id, question, answer_data, city, current_time)
+            print(f"💾 Saved conversation ({city}, {model}, {search_type}, {relevance}) at {current_time}")
+
+            # 70% of conversations get feedback
+            if random.random() < 0.7:
+                feedback = 1 if random.random() < 0.8 else -1
+                buffer.add_feedback(conversation_id, feedback, current_time)
+                print(f"📝 Feedback recorded ({'👍' if feedback > 0 else '👎'})")
+
+            current_time += timedelta(minutes=random.randint(3, 15))
+            conversation_count += 1
+
+            if conversation_count % 10 == 0:
+                print(f"Generated {conversation_count} conversations...")
 
     print(f"✅ Historical data generation complete. Total: {conversation_count} records.")
 
@@ -1,15 +1,44 @@
 import os
+import time
+import threading
+import functools
+from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2 import pool, extensions, sql
+from psycopg2.extras import DictCursor, execute_values
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 
 tz = ZoneInfo("Africa/Cairo")
 
+POOL_MIN_SIZE = int(os.getenv("POSTGRES_POOL_MIN", 1))
+POOL_MAX_SIZE = int(os.getenv("POSTGRES_POOL_MAX", 10))
+POOL_TIMEOUT = float(os.getenv("POSTGRES_POOL_TIMEOUT", 10))
+# Connections idle for longer than this are pinged before being handed out
+POOL_PING_AFTER = float(os.getenv("POSTGRES_POOL_PING_AFTER", 30))
 
-def get_db_connection():
-    return psycopg2.connect(
+BULK_PAGE_SIZE = int(os.getenv("POSTGRES_BULK_PAGE_SIZE", 1000))
+BUFFER_MAX_ROWS = int(os.getenv("POSTGRES_BUFFER_MAX_ROWS", 500))
+BUFFER_FLUSH_INTERVAL = float(os.getenv("POSTGRES_BUFFER_FLUSH_INTERVAL", 2.0))
+
+# Dashboard reads are served from memory for this many seconds (0 disables the cache).
+# Writes made through this module invalidate it right away; writes from other
+# processes show up once the entry expires.
+READ_CACHE_TTL = float(os.getenv("POSTGRES_READ_CACHE_TTL", 30))
+
+# conversations/feedback are range-partitioned by timestamp ('day' or 'week').
+# Pick the granularity before the partitioning migration runs; changing it later
+# only affects new partitions that do not overlap existing ones.
+PARTITION_INTERVAL = os.getenv("PARTITION_INTERVAL", "week")
+PARTITIONS_AHEAD = int(os.getenv("PARTITIONS_AHEAD", 4))
+PARTITIONED_TABLES = ("conversations", "feedback", "conversation_spans")
+if PARTITION_INTERVAL not in ("day", "week"):
+    raise ValueError(f"PARTITION_INTERVAL must be 'day' or 'week', got {PARTITION_INTERVAL!r}")
+
+
+def _connection_params():
+    return dict(
         host=os.getenv("POSTGRES_HOST", "localhost"),
         database=os.getenv("POSTGRES_DB", "travel_assistant"),
         user=os.getenv("POSTGRES_USER", "admin"),
@@ -18,135 +47,1072 @@ def get_db_connection():
     )
 
 
-def init_db():
-    conn = get_db_connection()
+def get_db_connection():
+    """Open a dedicated (unpooled) connection."""
+    return psycopg2.connect(**_connection_params())
+
+
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+_last_used = {}
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is None:
+            _pool = pool.ThreadedConnectionPool(POOL_MIN_SIZE, POOL_MAX_SIZE, **_connection_params())
+            if _pool_slots is None:
+                _pool_slots = threading.BoundedSemaphore(POOL_MAX_SIZE)
+        return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+
+def _is_healthy(conn):
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < POOL_PING_AFTER:
+        return True
     try:
         with conn.cursor() as cur:
-            cur.execute("DROP TABLE IF EXISTS feedback")
-            cur.execute("DROP TABLE IF EXISTS conversations")
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
-            cur.execute("""
-                CREATE TABLE conversations (
-                    id TEXT PRIMARY KEY,
-                    question TEXT NOT NULL,
-                    answer TEXT NOT NULL,
-                    city TEXT NOT NULL,
-                    model_used TEXT NOT NULL,
-                    response_time FLOAT NOT NULL,
-                    relevance TEXT NOT NULL,
-                    relevance_explanation TEXT NOT NULL,
-                    prompt_tokens INTEGER NOT NULL,
-                    completion_tokens INTEGER NOT NULL,
-                    total_tokens INTEGER NOT NULL,
-                    eval_prompt_tokens INTEGER NOT NULL,
-                    eval_completion_tokens INTEGER NOT NULL,
-                    eval_total_tokens INTEGER NOT NULL,
-                    search_type TEXT NOT NULL,
-                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+
+def _borrow(db_pool):
+    # Replace stale connections; give up after cycling through the whole pool
+    for _ in range(POOL_MAX_SIZE + 1):
+        conn = db_pool.getconn()
+        if _is_healthy(conn):
+            return conn
+        print("Discarding stale database connection")
+        _last_used.pop(id(conn), None)
+        db_pool.putconn(conn, close=True)
+    raise pool.PoolError("could not obtain a healthy database connection")
+
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection from the pool and return it when done.
+
+    Waits up to POSTGRES_POOL_TIMEOUT seconds for a free connection. A connection
+    that raised a connection-level error is closed instead of being returned,
+    and any transaction left open is rolled back.
+    """
+    db_pool = get_pool()
+    if not _pool_slots.acquire(timeout=POOL_TIMEOUT):
+        raise pool.PoolError(f"no database connection available after {POOL_TIMEOUT}s")
+
+    conn = None
+    broken = False
+    try:
+        conn = _borrow(db_pool)
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        if conn is not None:
+            if not broken and not conn.closed:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                _last_used[id(conn)] = time.monotonic()
+            else:
+                _last_used.pop(id(conn), None)
+            db_pool.putconn(conn, close=broken or bool(conn.closed))
+        _pool_slots.release()
+
+
+_read_cache = {}
+_read_cache_lock = threading.Lock()
+_read_cache_generation = 0
+
+
+def invalidate_read_cache():
+    """Drop every cached read; called after each write made through this module."""
+    global _read_cache_generation
+    with _read_cache_lock:
+        _read_cache.clear()
+        _read_cache_generation += 1
+
+
+def cached_read(fn):
+    """Cache a read function's result per arguments for READ_CACHE_TTL seconds."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if READ_CACHE_TTL <= 0:
+            return fn(*args, **kwargs)
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        with _read_cache_lock:
+            entry = _read_cache.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+            generation = _read_cache_generation
+
+        result = fn(*args, **kwargs)
+        with _read_cache_lock:
+            # A write that landed while we were querying makes this result stale
+            if generation == _read_cache_generation:
+                _read_cache[key] = (now + READ_CACHE_TTL, result)
+        return result
+
+    return wrapper
+
+
+# Secondary indexes for the app and dashboard queries
+INDEX_STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_conversations_relevance_timestamp ON conversations (relevance, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_conversations_model_timestamp ON conversations (model_used, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_feedback_conversation_id ON feedback (conversation_id)",
+]
+
+# Triggers that keep monitoring_rollups in sync with conversations and feedback
+ROLLUP_TRIGGER_STATEMENTS = [
+    "DROP TRIGGER IF EXISTS conversations_rollup_insert ON conversations",
+    """
+    CREATE TRIGGER conversations_rollup_insert
+    AFTER INSERT ON conversations
+    FOR EACH ROW EXECUTE FUNCTION conversations_rollup_trigger()
+    """,
+    "DROP TRIGGER IF EXISTS conversations_rollup_update ON conversations",
+    """
+    CREATE TRIGGER conversations_rollup_update
+    AFTER UPDATE OF relevance, eval_total_tokens ON conversations
+    FOR EACH ROW EXECUTE FUNCTION conversations_rollup_trigger()
+    """,
+    "DROP TRIGGER IF EXISTS feedback_rollup_insert ON feedback",
+    """
+    CREATE TRIGGER feedback_rollup_insert
+    AFTER INSERT ON feedback
+    FOR EACH ROW EXECUTE FUNCTION feedback_rollup_trigger()
+    """,
+]
+
+# Versioned, append-only schema migrations. Never edit a released migration;
+# add a new one instead. Each runs once, in its own transaction, and is recorded
+# in schema_migrations.
+MIGRATIONS = [
+    (1, "create conversations and feedback", [
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            city TEXT NOT NULL,
+            model_used TEXT NOT NULL,
+            response_time FLOAT NOT NULL,
+            relevance TEXT NOT NULL,
+            relevance_explanation TEXT NOT NULL,
+            prompt_tokens INTEGER NOT NULL,
+            completion_tokens INTEGER NOT NULL,
+            total_tokens INTEGER NOT NULL,
+            eval_prompt_tokens INTEGER NOT NULL,
+            eval_completion_tokens INTEGER NOT NULL,
+            eval_total_tokens INTEGER NOT NULL,
+            search_type TEXT NOT NULL,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS feedback (
+            id SERIAL PRIMARY KEY,
+            conversation_id TEXT REFERENCES conversations(id),
+            feedback INTEGER NOT NULL,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+        )
+        """,
+    ]),
+    (2, "add streaming latency metrics", [
+        "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS time_to_first_token FLOAT",
+        "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS tokens_per_second FLOAT",
+    ]),
+    (3, "add indexes for the app and dashboard queries", [
+        *INDEX_STATEMENTS,
+    ]),
+    (4, "add per-minute/per-hour monitoring rollups maintained by triggers", [
+        """
+        CREATE TABLE IF NOT EXISTS monitoring_rollups (
+            bucket TEXT NOT NULL,
+            bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+            model_used TEXT NOT NULL,
+            search_type TEXT NOT NULL,
+            city TEXT NOT NULL,
+            conversations BIGINT NOT NULL DEFAULT 0,
+            response_time_sum FLOAT NOT NULL DEFAULT 0,
+            response_time_max FLOAT,
+            latency_lt_1s BIGINT NOT NULL DEFAULT 0,
+            latency_lt_2s BIGINT NOT NULL DEFAULT 0,
+            latency_lt_5s BIGINT NOT NULL DEFAULT 0,
+            latency_ge_5s BIGINT NOT NULL DEFAULT 0,
+            prompt_tokens BIGINT NOT NULL DEFAULT 0,
+            completion_tokens BIGINT NOT NULL DEFAULT 0,
+            total_tokens BIGINT NOT NULL DEFAULT 0,
+            eval_total_tokens BIGINT NOT NULL DEFAULT 0,
+            relevant BIGINT NOT NULL DEFAULT 0,
+            partly_relevant BIGINT NOT NULL DEFAULT 0,
+            non_relevant BIGINT NOT NULL DEFAULT 0,
+            pending BIGINT NOT NULL DEFAULT 0,
+            unknown_relevance BIGINT NOT NULL DEFAULT 0,
+            thumbs_up BIGINT NOT NULL DEFAULT 0,
+            thumbs_down BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, bucket_start, model_used, search_type, city)
+        )
+        """,
+        """
+        CREATE OR REPLACE FUNCTION monitoring_rollup_apply(
+            p_ts TIMESTAMP WITH TIME ZONE, p_model TEXT, p_search TEXT, p_city TEXT,
+            p_conversations INTEGER, p_response_time FLOAT,
+            p_prompt_tokens BIGINT, p_completion_tokens BIGINT, p_total_tokens BIGINT,
+            p_eval_total_tokens BIGINT, p_relevance TEXT, p_relevance_delta INTEGER,
+            p_thumbs_up INTEGER, p_thumbs_down INTEGER
+        ) RETURNS void AS $$
+        DECLARE
+            bucket_name TEXT;
+        BEGIN
+            FOREACH bucket_name IN ARRAY ARRAY['minute', 'hour'] LOOP
+                INSERT INTO monitoring_rollups AS r (
+                    bucket, bucket_start, model_used, search_type, city,
+                    conversations, response_time_sum, response_time_max,
+                    latency_lt_1s, latency_lt_2s, latency_lt_5s, latency_ge_5s,
+                    prompt_tokens, completion_tokens, total_tokens, eval_total_tokens,
+                    relevant, partly_relevant, non_relevant, pending, unknown_relevance,
+                    thumbs_up, thumbs_down
+                ) VALUES (
+                    bucket_name, date_trunc(bucket_name, p_ts), p_model, p_search, p_city,
+                    p_conversations, COALESCE(p_response_time, 0) * p_conversations,
+                    CASE WHEN p_conversations > 0 THEN p_response_time END,
+                    CASE WHEN p_response_time < 1 THEN p_conversations ELSE 0 END,
+                    CASE WHEN p_response_time >= 1 AND p_response_time < 2 THEN p_conversations ELSE 0 END,
+                    CASE WHEN p_response_time >= 2 AND p_response_time < 5 THEN p_conversations ELSE 0 END,
+                    CASE WHEN p_response_time >= 5 THEN p_conversations ELSE 0 END,
+                    COALESCE(p_prompt_tokens, 0), COALESCE(p_completion_tokens, 0),
+                    COALESCE(p_total_tokens, 0), COALESCE(p_eval_total_tokens, 0),
+                    CASE WHEN p_relevance = 'RELEVANT' THEN p_relevance_delta ELSE 0 END,
+                    CASE WHEN p_relevance = 'PARTLY_RELEVANT' THEN p_relevance_delta ELSE 0 END,
+                    CASE WHEN p_relevance = 'NON_RELEVANT' THEN p_relevance_delta ELSE 0 END,
+                    CASE WHEN p_relevance = 'PENDING' THEN p_relevance_delta ELSE 0 END,
+                    CASE WHEN p_relevance IS NOT NULL
+                         AND p_relevance NOT IN ('RELEVANT', 'PARTLY_RELEVANT', 'NON_RELEVANT', 'PENDING')
+                         THEN p_relevance_delta ELSE 0 END,
+                    p_thumbs_up, p_thumbs_down
                 )
-            """)
+                ON CONFLICT (bucket, bucket_start, model_used, search_type, city) DO UPDATE SET
+                    conversations = r.conversations + EXCLUDED.conversations,
+                    response_time_sum = r.response_time_sum + EXCLUDED.response_time_sum,
+                    response_time_max = GREATEST(r.response_time_max, EXCLUDED.response_time_max),
+                    latency_lt_1s = r.latency_lt_1s + EXCLUDED.latency_lt_1s,
+                    latency_lt_2s = r.latency_lt_2s + EXCLUDED.latency_lt_2s,
+                    latency_lt_5s = r.latency_lt_5s + EXCLUDED.latency_lt_5s,
+                    latency_ge_5s = r.latency_ge_5s + EXCLUDED.latency_ge_5s,
+                    prompt_tokens = r.prompt_tokens + EXCLUDED.prompt_tokens,
+                    completion_tokens = r.completion_tokens + EXCLUDED.completion_tokens,
+                    total_tokens = r.total_tokens + EXCLUDED.total_tokens,
+                    eval_total_tokens = r.eval_total_tokens + EXCLUDED.eval_total_tokens,
+                    relevant = r.relevant + EXCLUDED.relevant,
+                    partly_relevant = r.partly_relevant + EXCLUDED.partly_relevant,
+                    non_relevant = r.non_relevant + EXCLUDED.non_relevant,
+                    pending = r.pending + EXCLUDED.pending,
+                    unknown_relevance = r.unknown_relevance + EXCLUDED.unknown_relevance,
+                    thumbs_up = r.thumbs_up + EXCLUDED.thumbs_up,
+                    thumbs_down = r.thumbs_down + EXCLUDED.thumbs_down;
+            END LOOP;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION conversations_rollup_trigger() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                PERFORM monitoring_rollup_apply(
+                    NEW.timestamp, NEW.model_used, NEW.search_type, NEW.city,
+                    1, NEW.response_time, NEW.prompt_tokens, NEW.completion_tokens,
+                    NEW.total_tokens, NEW.eval_total_tokens, NEW.relevance, 1, 0, 0);
+            ELSE
+                -- Relevance is filled in later by the judge: move the row between relevance counts
+                PERFORM monitoring_rollup_apply(
+                    OLD.timestamp, OLD.model_used, OLD.search_type, OLD.city,
+                    0, NULL, 0, 0, 0, -OLD.eval_total_tokens, OLD.relevance, -1, 0, 0);
+                PERFORM monitoring_rollup_apply(
+                    NEW.timestamp, NEW.model_used, NEW.search_type, NEW.city,
+                    0, NULL, 0, 0, 0, NEW.eval_total_tokens, NEW.relevance, 1, 0, 0);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE OR REPLACE FUNCTION feedback_rollup_trigger() RETURNS trigger AS $$
+        DECLARE
+            v_model TEXT;
+            v_search TEXT;
+            v_city TEXT;
+        BEGIN
+            SELECT model_used, search_type, city INTO v_model, v_search, v_city
+            FROM conversations WHERE id = NEW.conversation_id;
+            PERFORM monitoring_rollup_apply(
+                NEW.timestamp,
+                COALESCE(v_model, 'unknown'),
+                COALESCE(v_search, 'unknown'),
+                COALESCE(v_city, 'unknown'),
+                0, NULL, 0, 0, 0, 0, NULL, 0,
+                (NEW.feedback > 0)::int, (NEW.feedback < 0)::int);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        *ROLLUP_TRIGGER_STATEMENTS,
+        # Backfill from the rows that existed before the triggers
+        "TRUNCATE monitoring_rollups",
+        """
+        SELECT monitoring_rollup_apply(
+            timestamp, model_used, search_type, city, 1, response_time, prompt_tokens,
+            completion_tokens, total_tokens, eval_total_tokens, relevance, 1, 0, 0)
+        FROM conversations
+        """,
+        """
+        SELECT monitoring_rollup_apply(
+            f.timestamp, COALESCE(c.model_used, 'unknown'), COALESCE(c.search_type, 'unknown'),
+            COALESCE(c.city, 'unknown'), 0, NULL, 0, 0, 0, 0, NULL, 0,
+            (f.feedback > 0)::int, (f.feedback < 0)::int)
+        FROM feedback f
+        LEFT JOIN conversations c ON c.id = f.conversation_id
+        """,
+    ]),
+    (5, "partition conversations and feedback by time", [
+        """
+        CREATE OR REPLACE FUNCTION ensure_time_partitions(
+            parent TEXT, granularity TEXT, from_ts TIMESTAMP WITH TIME ZONE, to_ts TIMESTAMP WITH TIME ZONE
+        ) RETURNS INTEGER AS $$
+        DECLARE
+            start_ts TIMESTAMP WITH TIME ZONE := date_trunc(granularity, from_ts);
+            end_ts TIMESTAMP WITH TIME ZONE;
+            part_name TEXT;
+            created INTEGER := 0;
+        BEGIN
+            WHILE start_ts < to_ts LOOP
+                end_ts := start_ts + ('1 ' || granularity)::interval;
+                part_name := parent || '_p' || to_char(start_ts, 'YYYYMMDD');
+                IF to_regclass(part_name) IS NULL THEN
+                    BEGIN
+                        EXECUTE format(
+                            'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                            part_name, parent, start_ts, end_ts);
+                        created := created + 1;
+                    EXCEPTION WHEN others THEN
+                        -- e.g. overlaps a partition of another granularity, or rows already in the default partition
+                        RAISE NOTICE 'Skipping partition %: %', part_name, SQLERRM;
+                    END;
+                END IF;
+                start_ts := end_ts;
+            END LOOP;
+            RETURN created;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "ALTER TABLE feedback RENAME TO feedback_legacy",
+        "ALTER TABLE conversations RENAME TO conversations_legacy",
+        """
+        CREATE TABLE conversations (
+            id TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            city TEXT NOT NULL,
+            model_used TEXT NOT NULL,
+            response_time FLOAT NOT NULL,
+            time_to_first_token FLOAT,
+            tokens_per_second FLOAT,
+            relevance TEXT NOT NULL,
+            relevance_explanation TEXT NOT NULL,
+            prompt_tokens INTEGER NOT NULL,
+            completion_tokens INTEGER NOT NULL,
+            total_tokens INTEGER NOT NULL,
+            eval_prompt_tokens INTEGER NOT NULL,
+            eval_completion_tokens INTEGER NOT NULL,
+            eval_total_tokens INTEGER NOT NULL,
+            search_type TEXT NOT NULL,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+        """,
+        # The foreign key to conversations(id) cannot be kept: keys on a partitioned
+        # table must include the partition column.
+        """
+        CREATE TABLE feedback (
+            id BIGSERIAL,
+            conversation_id TEXT,
+            feedback INTEGER NOT NULL,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+        """,
+        "CREATE TABLE conversations_default PARTITION OF conversations DEFAULT",
+        "CREATE TABLE feedback_default PARTITION OF feedback DEFAULT",
+        f"""
+        SELECT ensure_time_partitions(
+            'conversations', '{PARTITION_INTERVAL}',
+            COALESCE((SELECT MIN(timestamp) FROM conversations_legacy), now()),
+            now() + interval '{PARTITIONS_AHEAD} {PARTITION_INTERVAL}')
+        """,
+        f"""
+        SELECT ensure_time_partitions(
+            'feedback', '{PARTITION_INTERVAL}',
+            COALESCE((SELECT MIN(timestamp) FROM feedback_legacy), now()),
+            now() + interval '{PARTITIONS_AHEAD} {PARTITION_INTERVAL}')
+        """,
+        # Copied before the rollup triggers exist, so existing rollups are not double counted
+        """
+        INSERT INTO conversations (
+            id, question, answer, city, model_used, response_time, time_to_first_token,
+            tokens_per_second, relevance, relevance_explanation, prompt_tokens,
+            completion_tokens, total_tokens, eval_prompt_tokens, eval_completion_tokens,
+            eval_total_tokens, search_type, timestamp
+        )
+        SELECT
+            id, question, answer, city, model_used, response_time, time_to_first_token,
+            tokens_per_second, relevance, relevance_explanation, prompt_tokens,
+            completion_tokens, total_tokens, eval_prompt_tokens, eval_completion_tokens,
+            eval_total_tokens, search_type, timestamp
+        FROM conversations_legacy
+        """,
+        """
+        INSERT INTO feedback (id, conversation_id, feedback, timestamp)
+        SELECT id, conversation_id, feedback, timestamp FROM feedback_legacy
+        """,
+        "SELECT setval(pg_get_serial_sequence('feedback', 'id'), COALESCE((SELECT MAX(id) FROM feedback), 0) + 1, false)",
+        "DROP TABLE feedback_legacy",
+        "DROP TABLE conversations_legacy",
+        *INDEX_STATEMENTS,
+        *ROLLUP_TRIGGER_STATEMENTS,
+    ]),
+    (6, "flag answers served from the semantic answer cache", [
+        "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS cached BOOLEAN NOT NULL DEFAULT FALSE",
+    ]),
+    (7, "add per-stage latency spans", [
+        # Linked to conversations.id without a foreign key, like feedback (see migration 5)
+        """
+        CREATE TABLE conversation_spans (
+            id BIGSERIAL,
+            conversation_id TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            backend TEXT,
+            duration_ms FLOAT NOT NULL,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+        """,
+        "CREATE TABLE conversation_spans_default PARTITION OF conversation_spans DEFAULT",
+        f"""
+        SELECT ensure_time_partitions(
+            'conversation_spans', '{PARTITION_INTERVAL}',
+            now(), now() + interval '{PARTITIONS_AHEAD} {PARTITION_INTERVAL}')
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_spans_conversation_id ON conversation_spans (conversation_id)",
+        "CREATE INDEX IF NOT EXISTS idx_spans_stage_timestamp ON conversation_spans (stage, timestamp)",
+    ]),
+    (8, "keep conversation ids unique across partitions", [
+        # The partitioned primary key is (id, timestamp), so uniqueness of id alone is
+        # checked here; the advisory lock serializes concurrent inserts of one id
+        """
+        CREATE OR REPLACE FUNCTION conversations_unique_id() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext(NEW.id));
+            IF EXISTS (SELECT 1 FROM conversations WHERE id = NEW.id) THEN
+                RAISE EXCEPTION 'duplicate conversation id %', NEW.id
+                    USING ERRCODE = 'unique_violation';
+            END IF;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        "DROP TRIGGER IF EXISTS conversations_unique_id ON conversations",
+        """
+        CREATE TRIGGER conversations_unique_id
+        BEFORE INSERT ON conversations
+        FOR EACH ROW EXECUTE FUNCTION conversations_unique_id()
+        """,
+        # Ids duplicated before this migration: attribute feedback to the latest question
+        """
+        CREATE OR REPLACE FUNCTION feedback_rollup_trigger() RETURNS trigger AS $$
+        DECLARE
+            v_model TEXT;
+            v_search TEXT;
+            v_city TEXT;
+        BEGIN
+            SELECT model_used, search_type, city INTO v_model, v_search, v_city
+            FROM conversations WHERE id = NEW.conversation_id
+            ORDER BY timestamp DESC LIMIT 1;
+            PERFORM monitoring_rollup_apply(
+                NEW.timestamp,
+                COALESCE(v_model, 'unknown'),
+                COALESCE(v_search, 'unknown'),
+                COALESCE(v_city, 'unknown'),
+                0, NULL, 0, 0, 0, 0, NULL, 0,
+                (NEW.feedback > 0)::int, (NEW.feedback < 0)::int);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+    ]),
+    (9, "move rows out of the default partition when their partition is created", [
+        # Postgres refuses a new partition while the default partition holds rows for
+        # its range, so those rows are moved into a detached table that is then attached.
+        # They are moved outside the parent, so the rollup triggers do not count them twice.
+        """
+        CREATE OR REPLACE FUNCTION ensure_time_partitions(
+            parent TEXT, granularity TEXT, from_ts TIMESTAMP WITH TIME ZONE, to_ts TIMESTAMP WITH TIME ZONE
+        ) RETURNS INTEGER AS $$
+        DECLARE
+            start_ts TIMESTAMP WITH TIME ZONE := date_trunc(granularity, from_ts);
+            end_ts TIMESTAMP WITH TIME ZONE;
+            part_name TEXT;
+            default_name TEXT := parent || '_default';
+            has_default_rows BOOLEAN;
+            created INTEGER := 0;
+        BEGIN
+            WHILE start_ts < to_ts LOOP
+                end_ts := start_ts + ('1 ' || granularity)::interval;
+                part_name := parent || '_p' || to_char(start_ts, 'YYYYMMDD');
+                IF to_regclass(part_name) IS NULL THEN
+                    BEGIN
+                        has_default_rows := false;
+                        IF to_regclass(default_name) IS NOT NULL THEN
+                            EXECUTE format(
+                                'SELECT EXISTS (SELECT 1 FROM %I WHERE timestamp >= %L AND timestamp < %L)',
+                                default_name, start_ts, end_ts) INTO has_default_rows;
+                        END IF;
+                        IF has_default_rows THEN
+                            EXECUTE format('LOCK TABLE %I IN ACCESS EXCLUSIVE MODE', parent);
+                            EXECUTE format(
+                                'CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                                part_name, parent);
+                            EXECUTE format(
+                                'WITH moved AS (DELETE FROM %I WHERE timestamp >= %L AND timestamp < %L RETURNING *) '
+                                'INSERT INTO %I SELECT * FROM moved',
+                                default_name, start_ts, end_ts, part_name);
+                            EXECUTE format(
+                                'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                                parent, part_name, start_ts, end_ts);
+                        ELSE
+                            EXECUTE format(
+                                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                                part_name, parent, start_ts, end_ts);
+                        END IF;
+                        created := created + 1;
+                    EXCEPTION WHEN others THEN
+                        -- e.g. overlaps a partition of another granularity
+                        RAISE NOTICE 'Skipping partition %: %', part_name, SQLERRM;
+                    END;
+                END IF;
+                start_ts := end_ts;
+            END LOOP;
+            RETURN created;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+    ]),
+]
+
+# Arbitrary key for pg_advisory_xact_lock so concurrent runners apply migrations one at a time
+MIGRATION_LOCK_KEY = 748213
+
+
+def get_schema_version():
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('schema_migrations')")
+            if cur.fetchone()[0] is None:
+                return 0
+            cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+            return cur.fetchone()[0]
+
+
+def run_migrations():
+    """Apply pending migrations without touching existing data. Safe to run repeatedly."""
+    applied = []
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
             cur.execute("""
-                CREATE TABLE feedback (
-                    id SERIAL PRIMARY KEY,
-                    conversation_id TEXT REFERENCES conversations(id),
-                    feedback INTEGER NOT NULL,
-                    timestamp TIMESTAMP WITH TIME ZONE NOT NULL
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP
                 )
             """)
         conn.commit()
-    finally:
-        conn.close()
 
+        for version, description, statements in MIGRATIONS:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_KEY,))
+                cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s", (version,))
+                if cur.fetchone():
+                    conn.rollback()
+                    continue
 
-def save_conversation(conversation_id, question, answer_data, city, timestamp=None):
+                print(f"Applying migration {version}: {description}")
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description),
+                )
+            conn.commit()
+            applied.append(version)
+
+    return applied
+
+
+def create_upcoming_partitions(ahead=PARTITIONS_AHEAD):
+    """
+    Make sure partitions exist from the current period up to `ahead` periods from now.
+
+    Rows that landed in a default partition (e.g. backdated ones) get their own
+    partition too, so the range starts at the oldest of them.
+    """
+    created = 0
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            for table in PARTITIONED_TABLES:
+                cur.execute(sql.SQL("SELECT LEAST(now(), MIN(timestamp)) FROM {}").format(
+                    sql.Identifier(f"{table}_default")))
+                from_ts = cur.fetchone()[0]
+                cur.execute(
+                    "SELECT ensure_time_partitions(%s, %s, %s, now() + %s::interval)",
+                    (table, PARTITION_INTERVAL, from_ts, f"{ahead} {PARTITION_INTERVAL}"),
+                )
+                created += cur.fetchone()[0]
+        conn.commit()
+    return created
+
+
+def init_db():
+    """Bring the schema up to date. Existing conversations and feedback are kept."""
+    applied = run_migrations()
+    created = create_upcoming_partitions()
+    print(f"Database schema at version {get_schema_version()} "
+          f"({len(applied)} migrations applied, {created} partitions created)")
+
+
+def reset_db():
+    """Drop all tables and rebuild the schema from scratch. Destroys all data."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS monitoring_rollups")
+            cur.execute("DROP TABLE IF EXISTS conversation_spans")
+            cur.execute("DROP TABLE IF EXISTS feedback")
+            cur.execute("DROP TABLE IF EXISTS conversations")
+            cur.execute("DROP TABLE IF EXISTS schema_migrations")
+            cur.execute("DROP FUNCTION IF EXISTS ensure_time_partitions(TEXT, TEXT, TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE)")
+        conn.commit()
+    invalidate_read_cache()
+    init_db()
+
+
+CONVERSATION_COLUMNS = (
+    "id", "question", "answer", "city", "model_used", "response_time", "time_to_first_token",
+    "tokens_per_second", "relevance", "relevance_explanation", "prompt_tokens",
+    "completion_tokens", "total_tokens", "eval_prompt_tokens", "eval_completion_tokens",
+    "eval_total_tokens", "search_type", "cached", "timestamp",
+)
+FEEDBACK_COLUMNS = ("conversation_id", "feedback", "timestamp")
+SPAN_COLUMNS = ("conversation_id", "stage", "backend", "duration_ms", "timestamp")
+
+
+def _conversation_row(conversation_id, question, answer_data, city, timestamp=None):
     if timestamp is None:
         timestamp = datetime.now(tz)
-    
-    conn = get_db_connection()
-    try:
+    return (
+        conversation_id,
+        question,
+        answer_data["answer"],
+        city,
+        answer_data["model_used"],
+        answer_data["response_time"],
+        answer_data.get("time_to_first_token"),
+        answer_data.get("tokens_per_second"),
+        answer_data["relevance"],
+        answer_data["relevance_explanation"],
+        answer_data["prompt_tokens"],
+        answer_data["completion_tokens"],
+        answer_data["total_tokens"],
+        answer_data["eval_prompt_tokens"],
+        answer_data["eval_completion_tokens"],
+        answer_data["eval_total_tokens"],
+        answer_data["search_type"],
+        answer_data.get("cached", False),
+        timestamp,
+    )
+
+
+def _feedback_row(conversation_id, feedback, timestamp=None):
+    if timestamp is None:
+        timestamp = datetime.now(tz)
+    return (conversation_id, feedback, timestamp)
+
+
+def save_conversation(conversation_id, question, answer_data, city, timestamp=None):
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                """
-                INSERT INTO conversations 
-                (id, question, answer, city, model_used, response_time, relevance, 
-                relevance_explanation, prompt_tokens, completion_tokens, total_tokens, 
-                eval_prompt_tokens, eval_completion_tokens, eval_total_tokens, search_type, timestamp)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))
+                f"""
+                INSERT INTO conversations ({", ".join(CONVERSATION_COLUMNS)})
+                VALUES ({", ".join(["%s"] * len(CONVERSATION_COLUMNS))})
             """,
-                (
-                    conversation_id,
-                    question,
-                    answer_data["answer"],
-                    city,
-                    answer_data["model_used"],
-                    answer_data["response_time"],
-                    answer_data["relevance"],
-                    answer_data["relevance_explanation"],
-                    answer_data["prompt_tokens"],
-                    answer_data["completion_tokens"],
-                    answer_data["total_tokens"],
-                    answer_data["eval_prompt_tokens"],
-                    answer_data["eval_completion_tokens"],
-                    answer_data["eval_total_tokens"],
-                    answer_data["search_type"],
-                    timestamp,
-                ),
+                _conversation_row(conversation_id, question, answer_data, city, timestamp),
             )
         conn.commit()
-    finally:
-        conn.close()
+    invalidate_read_cache()
 
 
 def save_feedback(conversation_id, feedback, timestamp=None):
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"INSERT INTO feedback ({', '.join(FEEDBACK_COLUMNS)}) VALUES (%s, %s, %s)",
+                _feedback_row(conversation_id, feedback, timestamp),
+            )
+        conn.commit()
+    invalidate_read_cache()
+
+
+def _insert_conversations(cur, rows):
+    execute_values(
+        cur,
+        f"INSERT INTO conversations ({', '.join(CONVERSATION_COLUMNS)}) VALUES %s",
+        rows,
+        page_size=BULK_PAGE_SIZE,
+    )
+
+
+def _insert_feedback(cur, rows):
+    execute_values(
+        cur,
+        f"INSERT INTO feedback ({', '.join(FEEDBACK_COLUMNS)}) VALUES %s",
+        rows,
+        page_size=BULK_PAGE_SIZE,
+    )
+
+
+def save_conversations_bulk(conversations):
+    """Insert many conversations in one transaction.
+
+    Args:
+        conversations: iterable of (conversation_id, question, answer_data, city, timestamp)
+            tuples, i.e. the arguments of save_conversation.
+    """
+    rows = [_conversation_row(*conversation) for conversation in conversations]
+    if not rows:
+        return 0
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            _insert_conversations(cur, rows)
+        conn.commit()
+    invalidate_read_cache()
+    return len(rows)
+
+
+def save_feedback_bulk(feedback_items):
+    """Insert many feedback rows in one transaction.
+
+    Args:
+        feedback_items: iterable of (conversation_id, feedback, timestamp) tuples.
+    """
+    rows = [_feedback_row(*item) for item in feedback_items]
+    if not rows:
+        return 0
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            _insert_feedback(cur, rows)
+        conn.commit()
+    invalidate_read_cache()
+    return len(rows)
+
+
+class WriteBuffer:
+    """
+    Write-behind buffer for conversations and feedback.
+
+    Rows are queued in memory and written with execute_values once `max_rows` are
+    pending or `flush_interval` seconds have passed, whichever comes first.
+    Conversations are written before feedback in the same transaction, so feedback
+    never references a conversation that is not stored yet. Use it as a context
+    manager (or call close()) to flush what is left.
+    """
+
+    def __init__(self, max_rows=BUFFER_MAX_ROWS, flush_interval=BUFFER_FLUSH_INTERVAL):
+        self.max_rows = max_rows
+        self.flush_interval = flush_interval
+        self._conversations = []
+        self._feedback = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self.written = 0
+        self._timer = threading.Thread(target=self._flush_periodically, name="db-write-buffer", daemon=True)
+        self._timer.start()
+
+    def add_conversation(self, conversation_id, question, answer_data, city, timestamp=None):
+        with self._lock:
+            self._conversations.append(
+                _conversation_row(conversation_id, question, answer_data, city, timestamp)
+            )
+            full = len(self._conversations) + len(self._feedback) >= self.max_rows
+        if full:
+            self.flush()
+
+    def add_feedback(self, conversation_id, feedback, timestamp=None):
+        with self._lock:
+            self._feedback.append(_feedback_row(conversation_id, feedback, timestamp))
+            full = len(self._conversations) + len(self._feedback) >= self.max_rows
+        if full:
+            self.flush()
+
+    def flush(self):
+        # One flush at a time keeps conversations ahead of the feedback that references them
+        with self._flush_lock:
+            with self._lock:
+                conversations, self._conversations = self._conversations, []
+                feedback, self._feedback = self._feedback, []
+            if not conversations and not feedback:
+                return 0
+
+            try:
+                with pooled_connection() as conn:
+                    with conn.cursor() as cur:
+                        if conversations:
+                            _insert_conversations(cur, conversations)
+                        if feedback:
+                            _insert_feedback(cur, feedback)
+                    conn.commit()
+            except Exception:
+                # Keep the rows for the next attempt
+                with self._lock:
+                    self._conversations[:0] = conversations
+                    self._feedback[:0] = feedback
+                raise
+
+            invalidate_read_cache()
+            self.written += len(conversations) + len(feedback)
+            return len(conversations) + len(feedback)
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Write buffer flush failed: {e}")
+
+    def close(self):
+        self._closed.set()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def save_spans(conversation_id, spans, timestamp=None):
+    """Store a request's stage timings (tracing.Trace.spans) for the conversation."""
+    if not spans:
+        return 0
     if timestamp is None:
         timestamp = datetime.now(tz)
+    rows = [
+        (conversation_id, span["stage"], span.get("backend"), span["duration_ms"], timestamp)
+        for span in spans
+    ]
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                f"INSERT INTO conversation_spans ({', '.join(SPAN_COLUMNS)}) VALUES %s",
+                rows,
+                page_size=BULK_PAGE_SIZE,
+            )
+        conn.commit()
+    return len(rows)
 
-    conn = get_db_connection()
-    try:
+
+def update_relevance(conversation_id, relevance, explanation, eval_tokens):
+    """Fill in the judge's verdict for a conversation saved as PENDING.
+
+    Only one row is updated: if an id was stored more than once (possible before
+    migration 8), the newest PENDING row wins. Returns the number of rows updated
+    (0 if the conversation is not saved yet).
+    """
+    with pooled_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
-                "INSERT INTO feedback (conversation_id, feedback, timestamp) VALUES (%s, %s, COALESCE(%s, CURRENT_TIMESTAMP))",
-                (conversation_id, feedback, timestamp),
+                """
+                UPDATE conversations
+                SET relevance = %s,
+                    relevance_explanation = %s,
+                    eval_prompt_tokens = %s,
+                    eval_completion_tokens = %s,
+                    eval_total_tokens = %s
+                WHERE (id, timestamp) = (
+                    SELECT id, timestamp
+                    FROM conversations
+                    WHERE id = %s
+                    ORDER BY relevance = 'PENDING' DESC, timestamp DESC
+                    LIMIT 1
+                )
+            """,
+                (
+                    relevance,
+                    explanation,
+                    eval_tokens.get("prompt_tokens") or 0,
+                    eval_tokens.get("completion_tokens") or 0,
+                    eval_tokens.get("total_tokens") or 0,
+                    conversation_id,
+                ),
             )
+            updated = cur.rowcount
         conn.commit()
-    finally:
-        conn.close()
+    invalidate_read_cache()
+    return updated
 
 
+def get_pending_conversations(limit=100):
+    with pooled_connection() as conn:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute(
+                """
+                SELECT id, question, answer
+                FROM conversations
+                WHERE relevance = 'PENDING'
+                ORDER BY timestamp
+                LIMIT %s
+            """,
+                (limit,),
+            )
+            return cur.fetchall()
+
+
+@cached_read
 def get_recent_conversations(limit=5, relevance=None):
-    conn = get_db_connection()
-    try:
+    with pooled_connection() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cur:
             query = """
                 SELECT c.*, f.feedback
                 FROM conversations c
                 LEFT JOIN feedback f ON c.id = f.conversation_id
             """
+            params = []
             if relevance:
-                query += f" WHERE c.relevance = '{relevance}'"
+                query += " WHERE c.relevance = %s"
+                params.append(relevance)
             query += " ORDER BY c.timestamp DESC LIMIT %s"
+            params.append(limit)
 
-            cur.execute(query, (limit,))
+            cur.execute(query, params)
             return cur.fetchall()
-    finally:
-        conn.close()
 
 
+@cached_read
 def get_feedback_stats():
-    conn = get_db_connection()
-    try:
+    """Thumbs up/down totals, read from the hourly rollups instead of scanning feedback."""
+    with pooled_connection() as conn:
         with conn.cursor(cursor_factory=DictCursor) as cur:
             cur.execute("""
                 SELECT 
-                    SUM(CASE WHEN feedback > 0 THEN 1 ELSE 0 END) as thumbs_up,
-                    SUM(CASE WHEN feedback < 0 THEN 1 ELSE 0 END) as thumbs_down
-                FROM feedback
+                    COALESCE(SUM(thumbs_up), 0) as thumbs_up,
+                    COALESCE(SUM(thumbs_down), 0) as thumbs_down
+                FROM monitoring_rollups
+                WHERE bucket = 'hour'
             """)
             return cur.fetchone()
-    finally:
-        conn.close()
-        
+
+
+def get_rollups(bucket="hour", since=None, group_by=None):
+    """Read monitoring rollups for dashboards.
+
+    Args:
+        bucket: 'minute' or 'hour'.
+        since: only buckets starting at or after this datetime.
+        group_by: optional list of dimensions to keep ('model_used', 'search_type',
+            'city'); the others are summed over. Defaults to keeping all of them.
+    """
+    if bucket not in ("minute", "hour"):
+        raise ValueError(f"Unknown bucket: {bucket}")
+    dimensions = ["model_used", "search_type", "city"]
+    if group_by is None:
+        group_by = dimensions
+    unknown = set(group_by) - set(dimensions)
+    if unknown:
+        raise ValueError(f"Unknown rollup dimensions: {sorted(unknown)}")
+
+    keys = ", ".join(["bucket_start"] + list(group_by))
+    query = f"""
+        SELECT {keys},
+            SUM(conversations) AS conversations,
+            SUM(response_time_sum) / NULLIF(SUM(conversations), 0) AS avg_response_time,
+            MAX(response_time_max) AS max_response_time,
+            SUM(latency_lt_1s) AS latency_lt_1s,
+            SUM(latency_lt_2s) AS latency_lt_2s,
+            SUM(latency_lt_5s) AS latency_lt_5s,
+            SUM(latency_ge_5s) AS latency_ge_5s,
+            SUM(prompt_tokens) AS prompt_tokens,
+            SUM(completion_tokens) AS completion_tokens,
+            SUM(total_tokens) AS total_tokens,
+            SUM(eval_total_tokens) AS eval_total_tokens,
+            SUM(relevant) AS relevant,
+            SUM(partly_relevant) AS partly_relevant,
+            SUM(non_relevant) AS non_relevant,
+            SUM(pending) AS pending,
+            SUM(unknown_relevance) AS unknown_relevance,
+            SUM(thumbs_up) AS thumbs_up,
+            SUM(thumbs_down) AS thumbs_down
+        FROM monitoring_rollups
+        WHERE bucket = %s AND (%s::timestamptz IS NULL OR bucket_start >= %s::timestamptz)
+        GROUP BY {keys}
+        ORDER BY bucket_start
+    """
+    with pooled_connection() as conn:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute(query, (bucket, since, since))
+            return cur.fetchall()
+
+
+def get_stage_latencies(since=None):
+    """p50/p95/p99 duration (ms) per stage and backend, e.g. for a latency breakdown panel."""
+    with pooled_connection() as conn:
+        with conn.cursor(cursor_factory=DictCursor) as cur:
+            cur.execute("""
+                SELECT stage, backend, COUNT(*) AS spans,
+                    percentile_cont(0.5) WITHIN GROUP (ORDER BY duration_ms) AS p50_ms,
+                    percentile_cont(0.95) WITHIN GROUP (ORDER BY duration_ms) AS p95_ms,
+                    percentile_cont(0.99) WITHIN GROUP (ORDER BY duration_ms) AS p99_ms
+                FROM conversation_spans
+                WHERE %s::timestamptz IS NULL OR timestamp >= %s::timestamptz
+                GROUP BY stage, backend
+                ORDER BY stage, backend
+            """, (since, since))
+            return cur.fetchall()
+
 if __name__ == "__main__":
-    init_db()
-    print("Database reinitialized successfully.")
+    import sys
+
+    if "--reset" in sys.argv:
+        reset_db()
+        print("Database reinitialized successfully.")
+    else:
+        init_db()
+        print("Database migrated successfully.")
         
\ No newline at end of file
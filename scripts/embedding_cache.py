@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # optional: no cross-process locking (e.g. on Windows)
+    fcntl = None
+
+
+# Relative paths are taken from the repository root
+EMBEDDING_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..",
+    os.path.expanduser(os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")),
+)
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding store for one model, keyed by the hash of the embedded text.
+
+    Vectors live in a flat `vectors.bin` file read through a memory map, and
+    `ids.json` maps each text hash to its row. New vectors are appended, so
+    re-embedding an edited corpus only writes the changed documents. Call flush()
+    once new vectors are in to persist their rows; writers in other processes (e.g.
+    the Elasticsearch and Qdrant indexers) are serialized with a lock file.
+    """
+
+    def __init__(self, model_name, cache_dir=EMBEDDING_CACHE_DIR, dtype=EMBEDDING_CACHE_DTYPE):
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.path = os.path.join(cache_dir, f"{safe_name}-{self.dtype.name}")
+        self.vectors_path = os.path.join(self.path, "vectors.bin")
+        self.ids_path = os.path.join(self.path, "ids.json")
+        self.lock_path = os.path.join(self.path, ".lock")
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self._load_ids()
+
+    def _read_ids(self):
+        try:
+            with open(self.ids_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _load_ids(self):
+        meta = self._read_ids()
+        self.dim = meta.get("dim")
+        self.rows = meta.get("rows", {})
+
+        # Drop entries that point past the end of the vectors file (e.g. interrupted write)
+        if self.dim:
+            stored = os.path.getsize(self.vectors_path) // (self.dim * self.dtype.itemsize) \
+                if os.path.exists(self.vectors_path) else 0
+            self.rows = {key: row for key, row in self.rows.items() if row < stored}
+
+    @contextmanager
+    def _file_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _matrix(self):
+        if not self.rows:
+            return None
+        n_rows = os.path.getsize(self.vectors_path) // (self.dim * self.dtype.itemsize)
+        return np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(n_rows, self.dim))
+
+    def get_many(self, texts):
+        """Return a list with the cached vector (float32) for each text, or None on a miss."""
+        with self._lock:
+            matrix = self._matrix()
+            result = []
+            for text in texts:
+                row = self.rows.get(text_hash(text))
+                result.append(None if row is None else np.asarray(matrix[row], dtype=np.float32))
+            return result
+
+    def put_many(self, texts, vectors):
+        """Append vectors for the given texts; their rows are persisted by flush()."""
+        vectors = np.asarray(vectors, dtype=self.dtype)
+        if vectors.ndim != 2 or len(vectors) != len(texts):
+            raise ValueError("vectors must be a 2-D array with one row per text")
+
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-d vectors for {self.model_name}, got {vectors.shape[1]}")
+
+            # The row offsets depend on the file size, so appends from other processes are serialized
+            with self._file_lock():
+                start = os.path.getsize(self.vectors_path) // (self.dim * self.dtype.itemsize) \
+                    if os.path.exists(self.vectors_path) else 0
+                with open(self.vectors_path, "ab") as f:
+                    f.write(np.ascontiguousarray(vectors).tobytes())
+
+            for offset, text in enumerate(texts):
+                self.rows[text_hash(text)] = start + offset
+                self._pending[text_hash(text)] = start + offset
+
+    def flush(self):
+        """Write the rows added since the last flush to `ids.json`, keeping rows other processes added."""
+        with self._lock:
+            if not self._pending:
+                return
+            with self._file_lock():
+                rows = self._read_ids().get("rows", {})
+                rows.update(self._pending)
+                tmp_path = f"{self.ids_path}.tmp-{os.getpid()}"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dim": self.dim, "rows": rows}, f)
+                os.replace(tmp_path, self.ids_path)
+            self.rows.update(rows)
+            self._pending = {}
+
+    def encode(self, texts, encode_fn):
+        """
+        Embed texts, calling `encode_fn` only for the texts not already cached.
+
+        Args:
+            texts (list of str): Texts to embed.
+            encode_fn (callable): Takes a list of texts and returns one vector per text.
+
+        Returns:
+            np.ndarray: float32 matrix with one row per input text.
+        """
+        cached = self.get_many(texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+
+        if missing:
+            # Embed each distinct missing text once
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            new_vectors = np.asarray(encode_fn(unique_texts), dtype=np.float32)
+            self.put_many(unique_texts, new_vectors)
+            by_text = dict(zip(unique_texts, new_vectors))
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return np.vstack(cached) if cached else np.empty((0, self.dim or 0), dtype=np.float32)
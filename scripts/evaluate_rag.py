@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+import assistant
+from prep import fetch_documents, load_ground_truth
+
+
+RESULT_DIR = os.getenv(
+    "RESULT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "result"),
+)
+EVAL_WORKERS = int(os.getenv("EVAL_WORKERS", 6))
+# LLM calls per second across all workers (each question makes two: answer + judge)
+EVAL_RATE_LIMIT = float(os.getenv("EVAL_RATE_LIMIT", 1.0))
+EVAL_BURST = int(os.getenv("EVAL_BURST", 2))
+EVAL_MAX_RETRIES = int(os.getenv("EVAL_MAX_RETRIES", 5))
+EVAL_RETRY_BACKOFF = float(os.getenv("EVAL_RETRY_BACKOFF", 2.0))
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def with_retries(fn, max_retries=EVAL_MAX_RETRIES, backoff=EVAL_RETRY_BACKOFF, limiter=None):
+    """Wrap `fn` so every attempt waits for the rate limiter and failures back off exponentially."""
+    def wrapper(*args, **kwargs):
+        for attempt in range(max_retries + 1):
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == max_retries:
+                    raise
+                delay = backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"LLM call failed ({e}), retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+    return wrapper
+
+
+def fake_llm(latency=0.05, failure_rate=0.0):
+    """Offline stand-in for assistant.llm with the same signature and return value.
+
+    Answers echo the first context passage of the prompt; judge prompts get a
+    RELEVANT verdict. `failure_rate` makes calls fail at random to exercise retries.
+    """
+    def llm(prompt, model_choice):
+        time.sleep(latency)
+        if random.random() < failure_rate:
+            raise RuntimeError("fake LLM failure")
+        if "Generated Answer:" in prompt:
+            answer = json.dumps({"Relevance": "RELEVANT", "Explanation": "Fake evaluation."})
+        else:
+            context = prompt.split("CONTEXT:", 1)[-1].strip()
+            answer = context.split("\n\n", 1)[0].split("A:", 1)[-1].strip()[:500] or "I cannot answer."
+        tokens = len(prompt.split())
+        token_info = {"prompt_tokens": tokens, "completion_tokens": len(answer.split()),
+                      "total_tokens": tokens + len(answer.split())}
+        return answer, token_info, latency
+    return llm
+
+
+def record_key(record):
+    # Row number keeps duplicate questions apart; the id guards against an edited file
+    return f"{record['row']}:{record['id']}"
+
+
+def read_checkpoint(path):
+    """Return {key: result} for every complete line of a JSONL checkpoint."""
+    done = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:  # torn last line after an interruption
+                    continue
+                done[result["key"]] = result
+    except OSError:
+        pass
+    return done
+
+
+def evaluate_record(record, doc_idx, model_choice, search_type):
+    start_time = time.time()
+    search_results = assistant.search(record["question"], record["city"], search_type)
+    prompt = assistant.build_prompt(record["question"], search_results)
+    answer, tokens, response_time = assistant.llm(prompt, model_choice)
+    relevance, explanation, eval_tokens = assistant.evaluate_relevance(record["question"], answer)
+
+    original_doc = doc_idx.get(record["id"], {})
+    return {
+        "key": record_key(record),
+        "answer_llm": answer,
+        "answer_org": original_doc.get("text", ""),
+        "document": record["id"],
+        "question": record["question"],
+        "city": record["city"],
+        "id": record["id"],
+        "model_used": model_choice,
+        "search_type": search_type,
+        "retrieved_ids": [doc.get("id") for doc in search_results],
+        "relevance": relevance,
+        "relevance_explanation": explanation,
+        "response_time": response_time,
+        "prompt_tokens": tokens.get("prompt_tokens"),
+        "completion_tokens": tokens.get("completion_tokens"),
+        "total_tokens": tokens.get("total_tokens"),
+        "eval_total_tokens": eval_tokens.get("total_tokens"),
+        "elapsed": round(time.time() - start_time, 3),
+    }
+
+
+def run_evaluation(ground_truth, checkpoint_path, model_choice, search_type, workers=EVAL_WORKERS):
+    """Evaluate every ground truth record not yet in the checkpoint.
+
+    Results are appended to `checkpoint_path` (JSONL) as soon as each record
+    finishes, so an interrupted run resumes where it stopped. Returns all results.
+    """
+    done = read_checkpoint(checkpoint_path)
+    pending = [record for record in ground_truth if record_key(record) not in done]
+    print(f"{len(done)} records already evaluated, {len(pending)} to go")
+
+    doc_idx = {doc["id"]: doc for doc in fetch_documents()}
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint_path)), exist_ok=True)
+    write_lock = threading.Lock()
+    failed = 0
+    start_time = time.time()
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        # Terminate a torn last line so the next result starts on a line of its own
+        if checkpoint.tell() > 0:
+            with open(checkpoint_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    checkpoint.write("\n")
+        futures = {
+            pool.submit(evaluate_record, record, doc_idx, model_choice, search_type): record
+            for record in pending
+        }
+        try:
+            for completed, future in enumerate(as_completed(futures), start=1):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Record {record_key(futures[future])} failed: {e}")
+                    continue
+                with write_lock:
+                    checkpoint.write(json.dumps(result) + "\n")
+                    checkpoint.flush()
+                done[result["key"]] = result
+                if completed % 50 == 0 or completed == len(futures):
+                    rate = completed / (time.time() - start_time)
+                    print(f"{completed}/{len(futures)} evaluated ({rate:.2f} records/sec)")
+        except KeyboardInterrupt:
+            print("Interrupted, finishing in-flight records; rerun to resume")
+            for future in futures:
+                future.cancel()
+            raise
+
+    if failed:
+        print(f"{failed} records failed; rerun to retry them")
+    keys = [record_key(record) for record in ground_truth]
+    return [done[key] for key in keys if key in done]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent, resumable offline RAG evaluation")
+    parser.add_argument("--model", default="mistral-medium-2508", choices=assistant.MISTRAL_MODELS)
+    parser.add_argument("--search-type", default="Qdrant", choices=assistant.SEARCH_TYPES)
+    parser.add_argument("--workers", type=int, default=EVAL_WORKERS)
+    parser.add_argument("--rate", type=float, default=EVAL_RATE_LIMIT,
+                        help="LLM calls per second across workers (0 = unlimited)")
+    parser.add_argument("--burst", type=int, default=EVAL_BURST)
+    parser.add_argument("--max-retries", type=int, default=EVAL_MAX_RETRIES)
+    parser.add_argument("--sample", type=int, help="evaluate a random sample of the ground truth")
+    parser.add_argument("--city", help="only questions for this city")
+    parser.add_argument("--checkpoint", help="JSONL checkpoint (default: data/result/eval-<model>-<search type>.jsonl)")
+    parser.add_argument("--restart", action="store_true", help="discard the checkpoint and start over")
+    parser.add_argument("--csv", help="also write the results as CSV (notebook column layout)")
+    parser.add_argument("--fake-llm", action="store_true", help="use an offline fake LLM instead of Mistral")
+    parser.add_argument("--fake-latency", type=float, default=0.05)
+    parser.add_argument("--fake-failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    checkpoint_path = args.checkpoint or os.path.join(
+        RESULT_DIR, f"eval-{args.model}-{args.search_type}{'-fake' if args.fake_llm else ''}.jsonl")
+    if args.restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    # Both the answer call and evaluate_relevance go through assistant.llm
+    base_llm = fake_llm(args.fake_latency, args.fake_failure_rate) if args.fake_llm else assistant.llm
+    limiter = TokenBucket(args.rate, args.burst)
+    assistant.llm = with_retries(base_llm, max_retries=args.max_retries, limiter=limiter)
+
+    ground_truth = load_ground_truth(city=args.city, sample=args.sample)
+    start_time = time.time()
+    results = run_evaluation(ground_truth, checkpoint_path, args.model, args.search_type, args.workers)
+    elapsed = time.time() - start_time
+
+    relevance = Counter(result["relevance"] for result in results)
+    print(f"Evaluated {len(results)}/{len(ground_truth)} records in {elapsed:.1f}s -> {checkpoint_path}")
+    for label, count in relevance.most_common():
+        print(f"  {label}: {count} ({count / len(results):.1%})")
+
+    if args.csv:
+        pd.DataFrame(results).drop(columns=["key", "retrieved_ids"]).to_csv(args.csv, index=False)
+        print(f"CSV written to {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
+import hashlib
+import json
+import os
+import shutil
+
 import pandas as pd
 
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from scipy.sparse import csr_matrix
 
 import numpy as np
 
@@ -13,6 +19,8 @@ warnings.warn(
     UserWarning,
 )
 
+SNAPSHOT_FORMAT_VERSION = 1
+
 
 class Index:
     """
@@ -23,8 +31,10 @@ class Index:
         keyword_fields (list): List of keyword field names to index.
         vectorizers (dict): Dictionary of TfidfVectorizer instances for each text field.
         keyword_df (pd.DataFrame): DataFrame containing keyword field data.
+        keyword_postings (dict): For each keyword field, a mapping from value to the sorted array of row indices holding it.
         text_matrices (dict): Dictionary of TF-IDF matrices for each text field.
         docs (list): List of documents indexed.
+        content_hash (str): Hash of the configuration and documents the index was fitted on.
     """
 
     def __init__(self, text_fields, keyword_fields=None, vectorizer_params=None):
@@ -40,13 +50,17 @@ class Index:
         self.keyword_fields = keyword_fields if keyword_fields is not None else []
         if vectorizer_params is None:
             vectorizer_params = {}
+        self.vectorizer_params = vectorizer_params
 
         self.vectorizers = {
             field: TfidfVectorizer(**vectorizer_params) for field in text_fields
         }
         self.keyword_df = None
+        self.keyword_postings = {}
         self.text_matrices = {}
         self.docs = []
+        self.content_hash = None
+        self._partitions = {}
 
     def fit(self, docs):
         """
@@ -67,13 +81,236 @@ class Index:
                 keyword_data[field].append(doc.get(field, ""))
 
         self.keyword_df = pd.DataFrame(keyword_data)
+        self._build_postings()
+        self.content_hash = self.compute_content_hash(docs)
 
         return self
 
+    def compute_content_hash(self, docs):
+        """
+        Computes a hash of the index configuration and the given documents.
+
+        Two indexes with the same hash are built from the same fields, vectorizer
+        parameters and documents, so a saved snapshot can be reused in place of a refit.
+
+        Args:
+            docs (list of dict): List of documents to hash.
+
+        Returns:
+            str: Hex SHA-256 digest.
+        """
+        config = {
+            "text_fields": self.text_fields,
+            "keyword_fields": self.keyword_fields,
+            "vectorizer_params": self.vectorizer_params,
+        }
+        digest = hashlib.sha256()
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode("utf-8"))
+        for doc in docs:
+            digest.update(json.dumps(doc, sort_keys=True, default=str).encode("utf-8"))
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+    def save(self, path):
+        """
+        Saves the fitted index to a snapshot directory.
+
+        The snapshot holds meta.json (fields, vectorizer parameters, vocabularies and
+        content hash), matrices.npz (CSR components and IDF weights per text field),
+        keywords.json (keyword columns) and docs.json (the document store). It is written
+        to a temporary directory first and swapped in, so readers never see a partial snapshot.
+
+        Args:
+            path (str): Directory to write the snapshot to. Replaced if it already exists.
+        """
+        arrays = {}
+        vocabularies = {}
+        for field in self.text_fields:
+            matrix = self.text_matrices[field].tocsr()
+            arrays[f"{field}__data"] = matrix.data
+            arrays[f"{field}__indices"] = matrix.indices
+            arrays[f"{field}__indptr"] = matrix.indptr
+            arrays[f"{field}__shape"] = np.asarray(matrix.shape)
+            arrays[f"{field}__idf"] = self.vectorizers[field].idf_
+            vocabularies[field] = {
+                term: int(column) for term, column in self.vectorizers[field].vocabulary_.items()
+            }
+
+        meta = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "content_hash": self.content_hash,
+            "text_fields": self.text_fields,
+            "keyword_fields": self.keyword_fields,
+            "vectorizer_params": self.vectorizer_params,
+            "vocabularies": vocabularies,
+        }
+        keywords = {field: self.keyword_df[field].tolist() for field in self.keyword_fields}
+
+        path = os.path.abspath(path)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        np.savez(os.path.join(tmp_path, "matrices.npz"), **arrays)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        with open(os.path.join(tmp_path, "keywords.json"), "w", encoding="utf-8") as f:
+            json.dump(keywords, f)
+        with open(os.path.join(tmp_path, "docs.json"), "w", encoding="utf-8") as f:
+            json.dump(self.docs, f)
+
+        old_path = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def read_content_hash(cls, path):
+        """
+        Reads the content hash of a snapshot without loading it.
+
+        Returns:
+            str or None: The stored hash, or None if there is no readable snapshot at path
+            or it was written with a different format version.
+        """
+        try:
+            with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            return None
+        return meta.get("content_hash")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index from a snapshot directory written by save.
+
+        Args:
+            path (str): Snapshot directory.
+
+        Returns:
+            Index: The restored index, ready to search.
+        """
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version: {meta.get('format_version')}")
+
+        index = cls(
+            text_fields=meta["text_fields"],
+            keyword_fields=meta["keyword_fields"],
+            vectorizer_params=meta["vectorizer_params"],
+        )
+
+        with np.load(os.path.join(path, "matrices.npz")) as arrays:
+            for field in index.text_fields:
+                vectorizer = index.vectorizers[field]
+                vectorizer.vocabulary_ = meta["vocabularies"][field]
+                vectorizer.idf_ = arrays[f"{field}__idf"]
+                index.text_matrices[field] = csr_matrix(
+                    (arrays[f"{field}__data"], arrays[f"{field}__indices"], arrays[f"{field}__indptr"]),
+                    shape=tuple(arrays[f"{field}__shape"]),
+                )
+
+        with open(os.path.join(path, "keywords.json"), encoding="utf-8") as f:
+            index.keyword_df = pd.DataFrame(json.load(f), columns=index.keyword_fields)
+        with open(os.path.join(path, "docs.json"), encoding="utf-8") as f:
+            index.docs = json.load(f)
+
+        index._build_postings()
+        index.content_hash = meta["content_hash"]
+
+        return index
+
+    def _build_postings(self):
+        """
+        Precomputes row-index postings for every keyword field value.
+        """
+        self.keyword_postings = {}
+        for field in self.keyword_fields:
+            postings = {}
+            for row, value in enumerate(self.keyword_df[field]):
+                postings.setdefault(value, []).append(row)
+            self.keyword_postings[field] = {
+                value: np.asarray(rows, dtype=np.int64) for value, rows in postings.items()
+            }
+        self._partitions = {}
+
+    def _partition(self, filter_dict):
+        """
+        Resolves a filter dictionary to the rows that pass it and their TF-IDF slices.
+
+        Args:
+            filter_dict (dict): Dictionary of keyword fields to filter by.
+
+        Returns:
+            tuple: (rows, matrices) where rows is None when no keyword filter applies
+            (i.e. the whole corpus) or an array of row indices, and matrices maps each
+            text field to the TF-IDF matrix restricted to those rows.
+        """
+        key = tuple(sorted(
+            (field, value) for field, value in filter_dict.items()
+            if field in self.keyword_fields
+        ))
+        if not key:
+            return None, self.text_matrices
+
+        if key not in self._partitions:
+            rows = None
+            empty = np.empty(0, dtype=np.int64)
+            for field, value in key:
+                posting = self.keyword_postings[field].get(value, empty)
+                rows = posting if rows is None else np.intersect1d(rows, posting, assume_unique=True)
+            matrices = {field: matrix[rows] for field, matrix in self.text_matrices.items()}
+            self._partitions[key] = (rows, matrices)
+
+        return self._partitions[key]
+
+    @staticmethod
+    def _top_k(scores, num_results):
+        """
+        Row-wise top-k over a 2-D score matrix.
+
+        Returns:
+            list of np.ndarray: For each row, the column indices of the best scoring entries,
+            highest first, with zero-score entries dropped.
+        """
+        k = min(num_results, scores.shape[1])
+        if k <= 0:
+            return [np.empty(0, dtype=np.int64) for _ in range(scores.shape[0])]
+
+        # Use argpartition to get top num_results indices, then sort each row's candidates
+        top_indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top_indices, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top_indices = np.take_along_axis(top_indices, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        # Filter out zero-score results
+        return [indices[row_scores > 0] for indices, row_scores in zip(top_indices, top_scores)]
+
+    def _score(self, queries, matrices, boost_dict):
+        """
+        Scores a list of queries against the given per-field TF-IDF matrices.
+        """
+        scores = None
+        # Compute cosine similarity for each text field and apply boost
+        for field in self.text_fields:
+            query_matrix = self.vectorizers[field].transform(queries)
+            sim = cosine_similarity(query_matrix, matrices[field]) * boost_dict.get(field, 1)
+            scores = sim if scores is None else scores + sim
+        return scores
+
     def search(self, query, filter_dict=None, boost_dict=None, num_results=10):
         """
         Searches the index with the given query, filters, and boost parameters.
 
+        Keyword filters are resolved against the precomputed postings first, so only the
+        documents that pass every filter are scored.
+
         Args:
             query (str): The search query string.
             filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by.
@@ -83,34 +320,50 @@ class Index:
         Returns:
             list of dict: List of documents matching the search criteria, ranked by relevance.
         """
-        if filter_dict is None:
-            filter_dict = {}
-        if boost_dict is None:
-            boost_dict = {}
+        return self.search_batch([query], [filter_dict or {}], boost_dict, num_results)[0]
 
-        query_vecs = {
-            field: self.vectorizers[field].transform([query])
-            for field in self.text_fields
-        }
-        scores = np.zeros(len(self.docs))
+    def search_batch(self, queries, filter_dicts=None, boost_dict=None, num_results=10):
+        """
+        Searches the index with many queries at once.
 
-        # Compute cosine similarity for each text field and apply boost
-        for field, query_vec in query_vecs.items():
-            sim = cosine_similarity(query_vec, self.text_matrices[field]).flatten()
-            boost = boost_dict.get(field, 1)
-            scores += sim * boost
+        Queries sharing the same filters are vectorized in a single transform call per text
+        field and scored with one sparse matrix product per field against the matching
+        partition only, followed by a row-wise top-k.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dicts (dict or list of dict): Either a single filter dictionary applied to every
+                query, or one filter dictionary per query. Defaults to no filtering.
+            boost_dict (dict): Dictionary of boost scores for text fields. Keys are field names and values are the boost scores.
+            num_results (int): The number of top results to return per query. Defaults to 10.
 
-        # Apply keyword filters
-        for field, value in filter_dict.items():
-            if field in self.keyword_fields:
-                mask = self.keyword_df[field] == value
-                scores = scores * mask.to_numpy()
+        Returns:
+            list of list of dict: For each query, the documents matching the search criteria, ranked by relevance.
+        """
+        if filter_dicts is None:
+            filter_dicts = {}
+        if isinstance(filter_dicts, dict):
+            filter_dicts = [filter_dicts] * len(queries)
+        if len(filter_dicts) != len(queries):
+            raise ValueError("filter_dicts must be a dict or have one entry per query")
+        if boost_dict is None:
+            boost_dict = {}
 
-        # Use argpartition to get top num_results indices
-        top_indices = np.argpartition(scores, -num_results)[-num_results:]
-        top_indices = top_indices[np.argsort(-scores[top_indices])]
+        # Group queries by partition so each group is scored with one product per field
+        groups = {}
+        for position, filter_dict in enumerate(filter_dicts):
+            rows, matrices = self._partition(filter_dict or {})
+            group = groups.setdefault(id(matrices), (rows, matrices, []))
+            group[2].append(position)
 
-        # Filter out zero-score results
-        top_docs = [self.docs[i] for i in top_indices if scores[i] > 0]
+        results = [[] for _ in queries]
+        for rows, matrices, positions in groups.values():
+            if rows is not None and len(rows) == 0:
+                continue
+            scores = self._score([queries[p] for p in positions], matrices, boost_dict)
+            for position, indices in zip(positions, self._top_k(scores, num_results)):
+                if rows is not None:
+                    indices = rows[indices]
+                results[position] = [self.docs[i] for i in indices]
 
-        return top_docs
+        return results
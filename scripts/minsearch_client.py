@@ -1,18 +1,47 @@
+import os
 import json
+import time
 import minsearch
 from prep import fetch_documents  # fetch documents from prep.py
 
 
-def build_minsearch_index():
-    """Build MinSearch index once and cache it."""
-    documents = fetch_documents()  # load documents once
+# Relative paths are taken from the repository root
+MINSEARCH_INDEX_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..",
+    os.path.expanduser(os.getenv("MINSEARCH_INDEX_PATH", "data/minsearch_index")),
+)
+
+
+def build_minsearch_index(documents=None, index_path=MINSEARCH_INDEX_PATH):
+    """Build MinSearch index once and cache it.
+
+    The fitted index is snapshotted to `index_path`, keyed by a content hash of the
+    documents and index configuration. If the snapshot matches, it is loaded instead
+    of refitting; otherwise the index is refitted and the snapshot replaced.
+    """
+    start_time = time.time()
+    if documents is None:
+        documents = fetch_documents()  # load documents once
     index = minsearch.Index(
         text_fields=['section', 'text'],
         keyword_fields=['id', 'city']
     )
+    content_hash = index.compute_content_hash(documents)
+
+    if minsearch.Index.read_content_hash(index_path) == content_hash:
+        try:
+            index = minsearch.Index.load(index_path)
+            print(f"MinSearch index loaded from snapshot with {len(index.docs)} documents "
+                  f"in {time.time() - start_time:.3f}s.")
+            return index
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Failed to load MinSearch snapshot, refitting: {e}")
+
     index.fit(documents)
     print(f"MinSearch index built with {len(documents)} documents.")
+    try:
+        index.save(index_path)
+        print(f"MinSearch snapshot saved to {index_path}")
+    except (OSError, TypeError) as e:
+        print(f"Could not save MinSearch snapshot: {e}")
     return index
-
-# Create a global cached index
-minsearch_index = build_minsearch_index()
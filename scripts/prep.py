@@ -1,41 +1,191 @@
 import os
+import time
+import hashlib
+import threading
 import requests
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-from elasticsearch import Elasticsearch
 from tqdm.auto import tqdm
 import json
 from db import init_db
+from embedding_cache import EmbeddingCache
 from dotenv import load_dotenv
 
+try:
+    import ijson
+except ImportError:  # optional: falls back to json.load
+    ijson = None
+
 load_dotenv()
 
 ELASTIC_URL = os.getenv("ELASTIC_URL_LOCAL")
 MODEL_NAME = os.getenv("MODEL_NAME")
 INDEX_NAME = os.getenv("INDEX_NAME")
 
+# Bulk ingestion tuning
+ES_ENCODE_BATCH_SIZE = int(os.getenv("ES_ENCODE_BATCH_SIZE", 64))
+ES_BULK_CHUNK_SIZE = int(os.getenv("ES_BULK_CHUNK_SIZE", 500))
+ES_BULK_THREADS = int(os.getenv("ES_BULK_THREADS", 4))
+
+# ANN profile of the `all_data_vector` kNN search, used when indexing (HNSW graph,
+# quantization) and when searching (k, num_candidates); see ES_ANN_PROFILES
+ES_ANN_PROFILE = os.getenv("ES_ANN_PROFILE", "exhaustive")
+ES_VECTOR_DIMS = 768
+
+ES_ANN_PROFILES = {
+    # num_candidates covers the whole corpus: exact results, no HNSW speedup
+    "exhaustive": {"index_type": "hnsw", "m": 16, "ef_construction": 100, "k": None, "num_candidates": 10000},
+    "balanced": {"index_type": "hnsw", "m": 16, "ef_construction": 100, "k": 10, "num_candidates": 100},
+    # int8 scalar-quantized graph (ES 8.12+); float vectors are kept on disk
+    "int8": {"index_type": "int8_hnsw", "m": 16, "ef_construction": 100, "k": 10, "num_candidates": 100},
+    "fast": {"index_type": "int8_hnsw", "m": 16, "ef_construction": 100, "k": 5, "num_candidates": 50},
+}
+
+
+def get_es_profile(name=ES_ANN_PROFILE):
+    if name not in ES_ANN_PROFILES:
+        raise ValueError(f"Unknown Elasticsearch ANN profile: {name}. Available: {list(ES_ANN_PROFILES)}")
+    return ES_ANN_PROFILES[name]
+
+
+def estimate_es_vector_memory_mb(name, num_vectors, dims=ES_VECTOR_DIMS):
+    """Off-heap RAM the kNN search wants for the vectors and graph (Elasticsearch sizing guide)."""
+    profile = get_es_profile(name)
+    per_vector = dims + 4 if profile["index_type"] == "int8_hnsw" else dims * 4
+    return round(num_vectors * (per_vector + 4 * profile["m"]) / 2**20, 2)
+
 
 
 BASE_URL = "https://github.com/HagerAhmed/Musafir/blob/main"
 
+# Local checkout of the data folder (preferred) and on-disk download cache (fallback).
+# Relative paths are taken from the repository root, so scripts run from any directory
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..",
+    os.path.expanduser(os.getenv("DATA_DIR", "data")),
+)
+DATA_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..",
+    os.path.expanduser(os.getenv("DATA_CACHE_DIR", "~/.cache/musafir")),
+)
+
+DOCUMENTS_PATH = "processed_data/documents-with-ids.json"
+GROUND_TRUTH_PATH = "result/groud-truth-retrieval.csv"
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_cache_meta(cache_path):
+    try:
+        with open(cache_path + ".meta.json", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _valid_cache(cache_path, meta):
+    """A cached file is only trusted if its content still matches the recorded hash."""
+    return (
+        os.path.isfile(cache_path)
+        and meta.get("sha256") is not None
+        and _sha256_file(cache_path) == meta["sha256"]
+    )
+
+
+def _download_to_cache(url, cache_path, meta):
+    """Download url into cache_path, revalidating an existing copy with its ETag."""
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+
+    with requests.get(url, headers=headers, stream=True, timeout=30) as response:
+        if response.status_code == 304:
+            print("Cached copy is up to date (ETag match)")
+            return
+        response.raise_for_status()
+
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.tmp-{os.getpid()}"
+        digest = hashlib.sha256()
+        with open(tmp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=1 << 16):
+                f.write(chunk)
+                digest.update(chunk)
+        os.replace(tmp_path, cache_path)
+
+        new_meta = {"url": url, "etag": response.headers.get("ETag"), "sha256": digest.hexdigest()}
+        with open(cache_path + ".meta.json", "w", encoding="utf-8") as f:
+            json.dump(new_meta, f)
+
+
+def resolve_data_file(relative_path):
+    """
+    Return a local path for a file from the repository's data folder.
+
+    Looks in DATA_DIR first. Otherwise the file is served from DATA_CACHE_DIR,
+    downloaded from GitHub when missing and revalidated with its ETag when present.
+    If the network is unavailable, a cached copy whose SHA-256 still matches is used.
+    """
+    local_path = os.path.join(DATA_DIR, relative_path)
+    if os.path.isfile(local_path):
+        return local_path
+
+    url = f"{BASE_URL}/data/{relative_path}?raw=1"
+    cache_path = os.path.join(DATA_CACHE_DIR, relative_path)
+    meta = _read_cache_meta(cache_path)
+    if not _valid_cache(cache_path, meta):
+        meta = {}
+
+    try:
+        print("Downloading from:", url)
+        _download_to_cache(url, cache_path, meta)
+    except requests.RequestException as e:
+        if not meta:
+            raise
+        print(f"Download failed ({e}), using cached copy")
+
+    return cache_path
+
+
+def _load_once(relative_path, parse):
+    """Parse a data file once per process, re-reading only if the file changes."""
+    path = resolve_data_file(relative_path)
+    stat = os.stat(path)
+    key = (relative_path, path, stat.st_mtime_ns, stat.st_size)
+    with _loaded_lock:
+        if key not in _loaded:
+            _loaded[key] = parse(path)
+        return _loaded[key]
+
+
+def _read_json_records(path):
+    """Read a JSON array of records, stream-parsing it when ijson is available."""
+    with open(path, "rb") as f:
+        if ijson is not None:
+            return list(ijson.items(f, "item", use_float=True))
+        return json.load(f)
+
 
 def fetch_documents():
     print("Fetching documents...")
-    relative_url = "data/processed_data/documents-with-ids.json"
-    docs_url = f"{BASE_URL}/{relative_url}?raw=1"
-    print("Downloading ground truth from:", docs_url)
-    docs_response = requests.get(docs_url)
-    documents = docs_response.json()
+    documents = _load_once(DOCUMENTS_PATH, _read_json_records)
+    # Callers annotate documents in place (e.g. with vectors), so hand out copies
+    documents = [dict(doc) for doc in documents]
     print(f"Fetched {len(documents)} documents")
     return documents
 
 
 def fetch_ground_truth():
     print("Fetching ground truth data...")
-    relative_url = "data/result/groud-truth-retrieval.csv"
-    ground_truth_url = f"{BASE_URL}/{relative_url}?raw=1"
-    df_ground_truth = pd.read_csv(ground_truth_url)
-    print("Downloading ground truth from:", ground_truth_url)
+    df_ground_truth = _load_once(GROUND_TRUTH_PATH, pd.read_csv)
 
     df_ground_truth = df_ground_truth[
         df_ground_truth.city == "cairo"
@@ -44,15 +194,35 @@ def fetch_ground_truth():
     print(f"Fetched {len(ground_truth)} ground truth records")
     return ground_truth
 
+
+def load_ground_truth(city=None, sample=None, seed=42):
+    """Ground truth records for the offline benchmark and evaluation scripts.
+
+    `row` is the record's line in the file, so duplicate questions stay apart.
+    """
+    df = _load_once(GROUND_TRUTH_PATH, pd.read_csv).copy()
+    df["row"] = range(len(df))
+    if city:
+        df = df[df.city.str.lower() == city.lower()]
+    if sample and sample < len(df):
+        df = df.sample(n=sample, random_state=seed)
+    return df.to_dict(orient="records")
+
 def load_model():
+    # Imported here so that fetch_documents (used by the MinSearch backend) does not pull in torch
+    from sentence_transformers import SentenceTransformer
+
     print(f"Loading model: {MODEL_NAME}")
     return SentenceTransformer(MODEL_NAME)
 
 # Setup Elasticsearch
-def setup_elasticsearch():
+def setup_elasticsearch(index_name=INDEX_NAME, profile=ES_ANN_PROFILE):
+    from elasticsearch import Elasticsearch
+
     print("Setting up Elasticsearch...")
     es_client = Elasticsearch(ELASTIC_URL)
     print("Here is the Elastic search data: ", es_client)
+    ann = get_es_profile(profile)
 
     index_settings = {
         "settings": {"number_of_shards": 1, "number_of_replicas": 0},
@@ -65,31 +235,105 @@ def setup_elasticsearch():
                 "id": {"type": "keyword"},
                 "all_data_vector": {
                     "type": "dense_vector",
-                    "dims": 768,
+                    "dims": ES_VECTOR_DIMS,
                     "index": True,
                     "similarity": "cosine",
+                    "index_options": {
+                        "type": ann["index_type"],
+                        "m": ann["m"],
+                        "ef_construction": ann["ef_construction"],
+                    },
                 },
             }
         },
     }
 
-    es_client.indices.delete(index=INDEX_NAME, ignore_unavailable=True)
-    es_client.indices.create(index=INDEX_NAME, body=index_settings)
-    print(f"Elasticsearch index '{INDEX_NAME}' created")
+    es_client.indices.delete(index=index_name, ignore_unavailable=True)
+    es_client.indices.create(index=index_name, body=index_settings)
+    print(f"Elasticsearch index '{index_name}' created (ANN profile: {profile})")
     return es_client
 
 
-def index_documents(es_client, documents, model):
+def _bulk_actions(documents, model, encode_batch_size, embedding_cache, index_name=INDEX_NAME):
+    """Yield bulk index actions, encoding documents one batch at a time.
+
+    Vectors already in the embedding cache are reused; only the misses hit the model.
+    """
+    for start in range(0, len(documents), encode_batch_size):
+        batch = documents[start:start + encode_batch_size]
+        texts = []
+        for doc in batch:
+            if pd.isna(doc.get("subsection")):
+                doc["subsection"] = ""
+            texts.append(doc["city"] + ' ' + doc['section'] + ' ' + doc["text"])
+
+        vectors = embedding_cache.encode(
+            texts, lambda missing: model.encode(missing, batch_size=encode_batch_size)
+        )
+        for doc, vector in zip(batch, vectors):
+            doc["all_data_vector"] = vector.tolist()
+            yield {"_index": index_name, "_id": doc["id"], "_source": doc}
+
+
+def index_documents(es_client, documents, model,
+                    encode_batch_size=ES_ENCODE_BATCH_SIZE,
+                    chunk_size=ES_BULK_CHUNK_SIZE,
+                    thread_count=ES_BULK_THREADS,
+                    index_name=INDEX_NAME):
+    """
+    Bulk-index documents with their `all_data_vector` embeddings.
+
+    Documents are encoded in batches of `encode_batch_size` and sent with the bulk API
+    in chunks of `chunk_size` (`parallel_bulk` with `thread_count` workers when
+    thread_count > 1). Refresh and replicas are disabled during the load and restored
+    afterwards.
+    """
+    from elasticsearch import helpers
+
     print("Indexing documents...")
-    for doc in tqdm(documents):
-        if pd.isna(doc.get("subsection")):
-            doc["subsection"] = ""
-        city = doc["city"]
-        section = doc['section']
-        text = doc["text"]
-        doc["all_data_vector"] = model.encode(city + ' ' + section + ' ' + text).tolist()
-        es_client.index(index=INDEX_NAME, document=doc)
-    print(f"Indexed {len(documents)} documents")
+    start_time = time.time()
+
+    current = es_client.indices.get_settings(index=index_name)[index_name]["settings"]["index"]
+    # None resets a setting to the cluster default when restored
+    original_settings = {
+        "refresh_interval": current.get("refresh_interval"),
+        "number_of_replicas": current.get("number_of_replicas"),
+    }
+    es_client.indices.put_settings(
+        index=index_name,
+        settings={"index": {"refresh_interval": "-1", "number_of_replicas": 0}},
+    )
+
+    embedding_cache = EmbeddingCache(MODEL_NAME)
+    indexed = 0
+    failed = 0
+    try:
+        actions = _bulk_actions(documents, model, encode_batch_size, embedding_cache, index_name)
+        if thread_count > 1:
+            results = helpers.parallel_bulk(
+                es_client, actions,
+                thread_count=thread_count, chunk_size=chunk_size, raise_on_error=False,
+            )
+        else:
+            results = helpers.streaming_bulk(
+                es_client, actions, chunk_size=chunk_size, raise_on_error=False,
+            )
+
+        for ok, item in tqdm(results, total=len(documents)):
+            if ok:
+                indexed += 1
+            else:
+                failed += 1
+                print("Failed to index document:", item)
+    finally:
+        embedding_cache.flush()
+        es_client.indices.put_settings(index=index_name, settings={"index": original_settings})
+        es_client.indices.refresh(index=index_name)
+
+    elapsed = time.time() - start_time
+    rate = indexed / elapsed if elapsed > 0 else float("inf")
+    print(f"Indexed {indexed} documents ({failed} failed) in {elapsed:.2f}s ({rate:.1f} docs/sec)")
+    print(f"Embedding cache: {embedding_cache.hits} hits, {embedding_cache.misses} encoded")
 
 
 def main():
@@ -2,10 +2,17 @@ import os
 import time
 import uuid
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import requests
 from qdrant_client import QdrantClient, models
 from prep import fetch_documents, fetch_ground_truth
+from embedding_cache import EmbeddingCache
+from qdrant_profiles import (
+    QDRANT_PROFILE, QDRANT_PROFILES, DENSE_VECTOR_SIZE, PAYLOAD_FIELDS,
+    get_profile, build_quantization_config, search_params, estimate_memory_mb,
+)
 
 
 # ==============================
@@ -15,6 +22,11 @@ QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME")
 MODEL_HANDLE = os.getenv("MODEL_HANDLE")
 
+QDRANT_BATCH_SIZE = int(os.getenv("QDRANT_BATCH_SIZE", 64))
+QDRANT_UPLOAD_WORKERS = int(os.getenv("QDRANT_UPLOAD_WORKERS", 4))
+# Namespace for the uuid5 point IDs derived from document ids
+POINT_ID_NAMESPACE = uuid.UUID("6f1c3e0a-5b8e-4c1e-9a55-7d2b8f0e4a31")
+
 
 # ==============================
 # Initialize Qdrant Client
@@ -30,80 +42,196 @@ print(f"✅ Connected to Qdrant at {QDRANT_URL}")
 # ==============================
 # Collection Initialization
 # ==============================
-def init_collection(collection_name: str):
-    """Create a Qdrant collection if it doesn’t exist."""
-    if qdrant_client.collection_exists(collection_name):
-        print(f"🗑 Deleting existing collection: {collection_name}")
-        qdrant_client.delete_collection(collection_name)
-        time.sleep(3)
-
-    try:
-        qdrant_client.create_collection(
+def init_collection(collection_name: str, client: QdrantClient = None, recreate: bool = False,
+                    profile: str = QDRANT_PROFILE):
+    """Create the Qdrant collection with `profile` if it doesn’t exist, else apply the profile to it."""
+    client = client or qdrant_client
+    settings = get_profile(profile)
+    hnsw_config = models.HnswConfigDiff(m=settings["hnsw_m"], ef_construct=settings["hnsw_ef_construct"])
+    quantization_config = build_quantization_config(settings)
+
+    if client.collection_exists(collection_name):
+        if recreate:
+            print(f"🗑 Deleting existing collection: {collection_name}")
+            client.delete_collection(collection_name)
+        else:
+            print(f"Using existing collection: {collection_name} (profile: {profile})")
+            client.update_collection(
+                collection_name=collection_name,
+                vectors_config={
+                    "jina-small": models.VectorParamsDiff(on_disk=settings["on_disk_vectors"]),
+                },
+                collection_params=models.CollectionParamsDiff(on_disk_payload=settings["on_disk_payload"]),
+                hnsw_config=hnsw_config,
+                quantization_config=quantization_config or models.Disabled.DISABLED,
+            )
+
+    if not client.collection_exists(collection_name):
+        try:
+            client.create_collection(
+                collection_name=collection_name,
+                vectors_config={
+                    'jina-small': models.VectorParams(
+                        size=DENSE_VECTOR_SIZE,
+                        distance=models.Distance.COSINE,
+                        on_disk=settings["on_disk_vectors"],
+                    ),
+                },
+                sparse_vectors_config={
+                    "bm25": models.SparseVectorParams(modifier=models.Modifier.IDF)
+                },
+                hnsw_config=hnsw_config,
+                quantization_config=quantization_config,
+                on_disk_payload=settings["on_disk_payload"],
+            )
+            print(f"Created new collection: {collection_name} (profile: {profile})")
+        except Exception as e:
+            print("Error creating collection:", e)
+            return
+
+    if settings["city_index"]:
+        client.create_payload_index(
             collection_name=collection_name,
-            vectors_config={
-                'jina-small': models.VectorParams(size=512, distance=models.Distance.COSINE),
-            },
-            sparse_vectors_config={
-                "bm25": models.SparseVectorParams(modifier=models.Modifier.IDF)
-            },
+            field_name="city",
+            field_schema=models.PayloadSchemaType.KEYWORD,
         )
-        print(f"Created new collection: {collection_name}")
-    except Exception as e:
-        print("Error creating collection:", e)
+
+
+# ==============================
+# Dense Embeddings (cached)
+# ==============================
+_dense_model = None
+
+
+def embed_dense(texts: list) -> list:
+    """Embed texts with the fastembed dense model, loading it on first use."""
+    global _dense_model
+    if _dense_model is None:
+        from fastembed import TextEmbedding
+        print(f"Loading dense model: {MODEL_HANDLE}")
+        _dense_model = TextEmbedding(MODEL_HANDLE)
+    return list(_dense_model.embed(texts))
 
 
 # ==============================
 # Indexing Function
 # ==============================
-def index_documents(documents: list, collection_name: str):
-    """Insert or update documents into Qdrant."""
-    if not documents:
-        print("No documents to index.")
-        return
+def point_id(doc_id) -> str:
+    """Stable point ID for a document, so re-indexing overwrites instead of duplicating."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, str(doc_id)))
+
 
-    print(f"📥 Indexing {len(documents)} documents...")
+def content_hash(doc: dict) -> str:
+    """Hash of everything that ends up in the point; the model is included so a model change re-embeds."""
+    payload = {field: doc.get(field) for field in PAYLOAD_FIELDS}
+    key = json.dumps({"model": MODEL_HANDLE, "payload": payload}, sort_keys=True, default=str)
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
-    points = [
+
+def stored_hashes(collection_name: str, client: QdrantClient = None, page_size: int = 1000) -> dict:
+    """Return {point id: content hash} for every point in the collection."""
+    client = client or qdrant_client
+    hashes = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=page_size,
+            offset=offset,
+            with_payload=["content_hash"],
+            with_vectors=False,
+        )
+        for point in points:
+            hashes[str(point.id)] = (point.payload or {}).get("content_hash")
+        if offset is None:
+            return hashes
+
+
+def _points(documents: list, hashes: list) -> list:
+    # Dense vectors come from the embedding cache; only new texts go through the model
+    embedding_cache = EmbeddingCache(MODEL_HANDLE)
+    dense_vectors = embedding_cache.encode([doc["text"] for doc in documents], embed_dense)
+    embedding_cache.flush()
+    print(f"Embedding cache: {embedding_cache.hits} hits, {embedding_cache.misses} encoded")
+
+    return [
         models.PointStruct(
-            id=uuid.uuid4().hex,
+            id=point_id(doc["id"]),
             vector={
-                "jina-small": models.Document(
-                    text=doc["text"],
-                    model=MODEL_HANDLE,
-                ),
+                "jina-small": dense_vector.tolist(),
                 "bm25": models.Document(
                     text=doc["text"],
                     model="Qdrant/bm25",
                 ),
             },
             payload={
-                "id": doc.get("id"),
-                "text": doc.get("text"),
-                "city": doc.get("city"),
-                "section": doc.get("section"),
-                "subsection": doc.get("subsection"),
+                **{field: doc.get(field) for field in PAYLOAD_FIELDS},
+                "content_hash": doc_hash,
             }
         )
-        for doc in documents
+        for doc, dense_vector, doc_hash in zip(documents, dense_vectors, hashes)
     ]
 
-    qdrant_client.upsert(collection_name=collection_name, points=points)
-    print(f"Successfully indexed {len(points)} points.")
+
+def index_documents(documents: list, collection_name: str, client: QdrantClient = None,
+                    batch_size: int = QDRANT_BATCH_SIZE, workers: int = QDRANT_UPLOAD_WORKERS):
+    """
+    Bring the collection in line with `documents`, touching only what changed.
+
+    Points are keyed by a UUID derived from the document id and carry a content
+    hash. New and changed documents are embedded and upserted in batches of
+    `batch_size` from `workers` threads. Points whose document is gone are deleted
+    once every upsert has succeeded.
+    """
+    client = client or qdrant_client
+    if not documents:
+        print("No documents to index.")
+        return
+    start_time = time.time()
+
+    existing = stored_hashes(collection_name, client)
+    wanted = {}
+    for doc in documents:
+        wanted[point_id(doc["id"])] = (doc, content_hash(doc))
+
+    changed = [(doc, doc_hash) for pid, (doc, doc_hash) in wanted.items() if existing.get(pid) != doc_hash]
+    removed = [pid for pid in existing if pid not in wanted]
+    print(f"📥 {len(changed)} new or changed, {len(removed)} removed, "
+          f"{len(wanted) - len(changed)} unchanged documents")
+
+    if changed:
+        points = _points([doc for doc, _ in changed], [doc_hash for _, doc_hash in changed])
+        batches = [points[start:start + batch_size] for start in range(0, len(points), batch_size)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(
+                lambda batch: client.upsert(collection_name=collection_name, points=batch, wait=True),
+                batches,
+            ))
+
+    # Only after every upsert went through, so a failed run never leaves the collection emptier
+    if removed:
+        for start in range(0, len(removed), batch_size):
+            client.delete(
+                collection_name=collection_name,
+                points_selector=models.PointIdsList(points=removed[start:start + batch_size]),
+            )
+
+    print(f"Successfully indexed {len(changed)} points in {time.time() - start_time:.2f}s.")
 
 
 # ==============================
 # Main Workflow
 # ==============================
-def main(reindex: bool = True):
+def main(reindex: bool = True, recreate: bool = False, profile: str = QDRANT_PROFILE):
     print("Starting Qdrant indexing process...")
 
     # Step 1: Fetch data
     documents = fetch_documents()
     ground_truth = fetch_ground_truth()
 
-    # Step 2: Initialize or reuse collection
+    # Step 2: Initialize or reuse collection, then sync only what changed
     if reindex:
-        init_collection(QDRANT_COLLECTION_NAME)
+        init_collection(QDRANT_COLLECTION_NAME, recreate=recreate, profile=profile)
         index_documents(documents, QDRANT_COLLECTION_NAME)
     else:
         print("Skipping re-indexing (using existing collection).")
@@ -112,4 +240,11 @@ def main(reindex: bool = True):
 
 
 if __name__ == "__main__":
-    main(reindex=True)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Index the documents into Qdrant")
+    parser.add_argument("--recreate", action="store_true",
+                        help="drop the collection and index everything from scratch")
+    parser.add_argument("--profile", default=QDRANT_PROFILE, choices=list(QDRANT_PROFILES))
+    args = parser.parse_args()
+    main(reindex=True, recreate=args.recreate, profile=args.profile)
@@ -0,0 +1,95 @@
+import os
+import json
+from qdrant_client import models
+
+
+# ==============================
+# Collection Profiles
+# ==============================
+# Shared by qdrant.py (indexing) and retrievers.py (search). Importing this module has
+# no side effects, so the Qdrant retriever reads it without connecting or loading data.
+QDRANT_PROFILE = os.getenv("QDRANT_PROFILE", "default")
+DENSE_VECTOR_SIZE = 512
+PAYLOAD_FIELDS = ["id", "text", "city", "section", "subsection"]
+
+# Every profile indexes `city` (the filter of every query); the rest trades recall for
+# memory and latency. Switching profile on an existing collection needs no re-embedding.
+PROFILE_DEFAULTS = {
+    "city_index": True,
+    "hnsw_m": 16,
+    "hnsw_ef_construct": 100,
+    "hnsw_ef": None,            # search beam, None = Qdrant default
+    "quantization": None,       # None or "int8"
+    "quantile": 0.99,
+    "rescore": True,            # re-rank quantized candidates with the float vectors
+    "oversampling": None,
+    "on_disk_vectors": False,
+    "on_disk_payload": False,
+}
+
+QDRANT_PROFILES = {
+    # Float vectors and payload in RAM (the previous layout)
+    "default": {},
+    # int8 copies of the vectors for search, floats kept for rescoring
+    "int8": {"quantization": "int8", "oversampling": 2.0},
+    # int8 vectors in RAM, float vectors and payload on disk
+    "low_memory": {"quantization": "int8", "oversampling": 2.0,
+                   "on_disk_vectors": True, "on_disk_payload": True},
+    # Sparser graph and narrower search beam
+    "fast": {"hnsw_m": 8, "hnsw_ef_construct": 64, "hnsw_ef": 32,
+             "quantization": "int8", "oversampling": 1.5},
+}
+
+
+def get_profile(name: str = QDRANT_PROFILE) -> dict:
+    if name not in QDRANT_PROFILES:
+        raise ValueError(f"Unknown Qdrant profile: {name}. Available: {list(QDRANT_PROFILES)}")
+    return {**PROFILE_DEFAULTS, **QDRANT_PROFILES[name]}
+
+
+def build_quantization_config(profile: dict):
+    if profile["quantization"] != "int8":
+        return None
+    return models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(
+            type=models.ScalarType.INT8,
+            quantile=profile["quantile"],
+            always_ram=True,
+        )
+    )
+
+
+def search_params(profile_name: str = QDRANT_PROFILE):
+    """SearchParams for the dense prefetch of a profile, or None for Qdrant's defaults."""
+    profile = get_profile(profile_name)
+    quantization = None
+    if profile["quantization"]:
+        quantization = models.QuantizationSearchParams(
+            rescore=profile["rescore"],
+            oversampling=profile["oversampling"],
+        )
+    if profile["hnsw_ef"] is None and quantization is None:
+        return None
+    return models.SearchParams(hnsw_ef=profile["hnsw_ef"], quantization=quantization)
+
+
+def estimate_memory_mb(profile_name: str, documents: list) -> dict:
+    """Rough RAM needed by the dense vectors, HNSW links and payload of a profile."""
+    profile = get_profile(profile_name)
+    points = len(documents)
+    float_vectors = points * DENSE_VECTOR_SIZE * 4
+    int8_vectors = points * DENSE_VECTOR_SIZE if profile["quantization"] == "int8" else 0
+    # Layer 0 keeps 2 * m links per point, 4 bytes each
+    hnsw_links = points * 2 * profile["hnsw_m"] * 4
+    payload = sum(len(json.dumps({field: doc.get(field) for field in PAYLOAD_FIELDS}, default=str))
+                  for doc in documents)
+    ram = int8_vectors + hnsw_links
+    ram += 0 if profile["on_disk_vectors"] else float_vectors
+    ram += 0 if profile["on_disk_payload"] else payload
+    return {
+        "ram_mb": round(ram / 2**20, 2),
+        "float_vectors_mb": round(float_vectors / 2**20, 2),
+        "int8_vectors_mb": round(int8_vectors / 2**20, 2),
+        "hnsw_links_mb": round(hnsw_links / 2**20, 2),
+        "payload_mb": round(payload / 2**20, 2),
+    }
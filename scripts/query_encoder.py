@@ -0,0 +1,132 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))
+ENCODER_MAX_BATCH = int(os.getenv("ENCODER_MAX_BATCH", 32))
+ENCODER_MAX_WAIT_MS = float(os.getenv("ENCODER_MAX_WAIT_MS", 5))
+
+
+def normalize_query(query):
+    """Cache key for a query; the model still encodes the query as it was given."""
+    return " ".join(query.split()).lower()
+
+
+class QueryEncoder:
+    """
+    Shared query encoder with an LRU cache and micro-batching.
+
+    Cache hits return immediately. Misses are queued for a background thread that
+    collects concurrent requests for up to `max_wait_ms` (or `max_batch_size` items)
+    and encodes them in one batched forward pass.
+    """
+
+    def __init__(self, model, cache_size=QUERY_CACHE_SIZE,
+                 max_batch_size=ENCODER_MAX_BATCH, max_wait_ms=ENCODER_MAX_WAIT_MS):
+        self.model = model
+        self.cache_size = cache_size
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+        self.batched_items = 0
+        self.largest_batch = 0
+
+    def encode(self, query):
+        """Return the embedding for a query, from the cache or a batched model call."""
+        return self._submit(query).result()
+
+    def encode_batch(self, queries):
+        """Return embeddings for many queries; the misses are queued together so they share forward passes."""
+        futures = [self._submit(query) for query in queries]
+        return [future.result() for future in futures]
+
+    def _submit(self, query):
+        key = normalize_query(query)
+        future = Future()
+
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                future.set_result(vector)
+                return future
+            self.misses += 1
+
+        self._ensure_worker()
+        self._queue.put((key, query, future))
+        return future
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="query-encoder", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        # Queries with the same cache key arriving in the same window share one slot in
+        # the batch, which encodes the first of them as it was given
+        texts = {}
+        for key, query, _ in batch:
+            texts.setdefault(key, query)
+        try:
+            vectors = self.model.encode(list(texts.values()), batch_size=len(texts))
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        by_key = dict(zip(texts, vectors))
+        with self._cache_lock:
+            for key, vector in by_key.items():
+                self._cache[key] = vector
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+            self.batches += 1
+            self.batched_items += len(texts)
+            self.largest_batch = max(self.largest_batch, len(texts))
+
+        for key, _, future in batch:
+            future.set_result(by_key[key])
+
+    def stats(self):
+        with self._cache_lock:
+            lookups = self.hits + self.misses
+            return {
+                "cache_size": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "batches": self.batches,
+                "avg_batch_size": self.batched_items / self.batches if self.batches else 0.0,
+                "max_batch_size": self.largest_batch,
+            }
@@ -0,0 +1,131 @@
+import os
+import queue
+import threading
+import time
+
+
+JUDGE_WORKERS = int(os.getenv("JUDGE_WORKERS", 2))
+JUDGE_QUEUE_SIZE = int(os.getenv("JUDGE_QUEUE_SIZE", 100))
+JUDGE_MAX_RETRIES = int(os.getenv("JUDGE_MAX_RETRIES", 3))
+JUDGE_RETRY_BACKOFF = float(os.getenv("JUDGE_RETRY_BACKOFF", 2.0))
+
+
+class RelevanceJudge:
+    """
+    Background pool that judges saved conversations off the request path.
+
+    `submit` queues a (conversation_id, question, answer) job without blocking; the
+    workers call `evaluate_fn(question, answer)` and store the verdict with
+    `update_fn(conversation_id, relevance, explanation, eval_tokens)`. Failures are
+    retried with exponential backoff. When the queue is full the job is dropped and
+    the row stays PENDING until a later `judge_pending` sweep picks it up.
+    If given, `span_fn(conversation_id, seconds)` receives the duration of the
+    `evaluate_fn` call that produced the verdict, without retry backoff or the write.
+    """
+
+    def __init__(self, evaluate_fn, update_fn, workers=JUDGE_WORKERS,
+                 queue_size=JUDGE_QUEUE_SIZE, max_retries=JUDGE_MAX_RETRIES,
+                 retry_backoff=JUDGE_RETRY_BACKOFF, span_fn=None):
+        self.evaluate_fn = evaluate_fn
+        self.update_fn = update_fn
+        self.span_fn = span_fn
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+        self.judged = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def _ensure_workers(self):
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._run, name="relevance-judge", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, conversation_id, question, answer):
+        """Queue a conversation for judging. Returns False if the queue is full."""
+        self._ensure_workers()
+        try:
+            self._queue.put_nowait((conversation_id, question, answer))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            print(f"Relevance queue full, conversation {conversation_id} stays PENDING")
+            return False
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._judge(*job)
+            finally:
+                self._queue.task_done()
+
+    def _judge(self, conversation_id, question, answer):
+        for attempt in range(self.max_retries + 1):
+            try:
+                start_time = time.perf_counter()
+                relevance, explanation, eval_tokens = self.evaluate_fn(question, answer)
+                judge_time = time.perf_counter() - start_time
+                if not self.update_fn(conversation_id, relevance, explanation, eval_tokens):
+                    raise LookupError(f"conversation {conversation_id} not found")
+                with self._lock:
+                    self.judged += 1
+                if self.span_fn is not None:
+                    try:
+                        self.span_fn(conversation_id, judge_time)
+                    except Exception as e:
+                        print(f"Could not record judge span for {conversation_id}: {e}")
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"Judging {conversation_id} failed after {attempt + 1} attempts: {e}")
+                    break
+                time.sleep(self.retry_backoff * (2 ** attempt))
+
+        with self._lock:
+            self.failed += 1
+        try:
+            self.update_fn(conversation_id, "UNKNOWN", "Evaluation failed", {})
+        except Exception as e:
+            print(f"Could not mark {conversation_id} as UNKNOWN: {e}")
+
+    def judge_pending(self, get_pending_fn, limit=100):
+        """Queue conversations still PENDING in the database (e.g. after a restart)."""
+        queued = 0
+        for row in get_pending_fn(limit):
+            if not self.submit(row["id"], row["question"], row["answer"]):
+                break
+            queued += 1
+        return queued
+
+    def join(self):
+        """Block until every queued job has been processed."""
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "judged": self.judged,
+                "failed": self.failed,
+                "dropped": self.dropped,
+            }
+
+
+if __name__ == "__main__":
+    from assistant import evaluate_relevance
+    from db import update_relevance, get_pending_conversations
+
+    judge = RelevanceJudge(evaluate_relevance, update_relevance)
+    print(f"Queued {judge.judge_pending(get_pending_conversations, limit=JUDGE_QUEUE_SIZE)} pending conversations")
+    judge.join()
+    print(f"Done: {judge.stats()}")
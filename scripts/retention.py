@@ -0,0 +1,118 @@
+import os
+import re
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from db import pooled_connection, create_upcoming_partitions, tz, PARTITIONED_TABLES
+
+
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 90))
+MINUTE_ROLLUP_RETENTION_DAYS = int(os.getenv("MINUTE_ROLLUP_RETENTION_DAYS", 14))
+# Relative paths are taken from the repository root
+ARCHIVE_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..",
+    os.path.expanduser(os.getenv("ARCHIVE_DIR", os.path.join("data", "archive"))),
+)
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", 3600))
+
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def list_partitions(parent):
+    """Return (name, upper_bound) for each range partition of `parent`, oldest first."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                JOIN pg_class p ON p.oid = i.inhparent
+                WHERE p.relname = %s
+            """, (parent,))
+            rows = cur.fetchall()
+
+    partitions = []
+    for name, bound in rows:
+        match = _UPPER_BOUND.search(bound or "")
+        if match is None:  # the DEFAULT partition is never archived
+            continue
+        partitions.append((name, datetime.fromisoformat(match.group(1))))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def export_partition(name, archive_dir=ARCHIVE_DIR):
+    """Write every row of a partition to <archive_dir>/<name>.parquet and return the path."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            # name comes from pg_class, not from user input
+            cur.execute(f'SELECT * FROM "{name}"')
+            columns = [column.name for column in cur.description]
+            df = pd.DataFrame(cur.fetchall(), columns=columns)
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.parquet")
+    tmp_path = f"{path}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path, len(df)
+
+
+def detach_partition(parent, name):
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f'ALTER TABLE "{parent}" DETACH PARTITION "{name}"')
+            cur.execute(f'DROP TABLE "{name}"')
+        conn.commit()
+
+
+def archive_cold_partitions(retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR):
+    """Export partitions entirely older than the retention window to Parquet, then detach and drop them.
+
+    Rollups are kept, so dashboards still cover archived periods.
+    """
+    cutoff = datetime.now(tz) - timedelta(days=retention_days)
+    archived = []
+    for parent in PARTITIONED_TABLES:
+        for name, upper_bound in list_partitions(parent):
+            if upper_bound > cutoff:
+                break
+            path, rows = export_partition(name, os.path.join(archive_dir, parent))
+            detach_partition(parent, name)
+            print(f"🗄 Archived {name} ({rows} rows) to {path}")
+            archived.append(name)
+    return archived
+
+
+def prune_minute_rollups(retention_days=MINUTE_ROLLUP_RETENTION_DAYS):
+    """Minute buckets are only useful for recent panels; hourly buckets are kept."""
+    with pooled_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM monitoring_rollups WHERE bucket = 'minute' AND bucket_start < %s",
+                (datetime.now(tz) - timedelta(days=retention_days),),
+            )
+            deleted = cur.rowcount
+        conn.commit()
+    return deleted
+
+
+def run_once():
+    created = create_upcoming_partitions()
+    archived = archive_cold_partitions()
+    pruned = prune_minute_rollups()
+    print(f"Retention run: {created} partitions created, {len(archived)} archived, "
+          f"{pruned} minute rollups pruned")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partition maintenance and Parquet archival")
+    parser.add_argument("--loop", action="store_true", help="keep running every RETENTION_INTERVAL_SECONDS")
+    args = parser.parse_args()
+
+    run_once()
+    while args.loop:
+        time.sleep(RETENTION_INTERVAL_SECONDS)
+        run_once()
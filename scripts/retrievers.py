@@ -0,0 +1,476 @@
+import os
+import sys
+import time
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ELASTIC_URL = os.getenv("ELASTIC_URL_LOCAL", "http://localhost:9200")
+ES_INDEX_NAME = os.getenv("ES_SEARCH_INDEX", "traveller_vector")
+QUERY_MODEL_NAME = os.getenv("QUERY_MODEL_NAME", "multi-qa-distilbert-cos-v1")
+
+QDRANT_URL = os.getenv("QDRANT_URL")
+QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME")
+MODEL_HANDLE = os.getenv("MODEL_HANDLE")
+
+# Per-request timeout of the Elasticsearch and Qdrant searches of an ensemble request.
+# Defaults to the ensemble timeout so that a hung backend frees its ensemble worker
+# when the request gives up; other Elasticsearch searches keep the client default.
+SEARCH_TIMEOUT = float(os.getenv("SEARCH_TIMEOUT", os.getenv("ENSEMBLE_TIMEOUT", 5)))
+
+# Searches per _msearch request in the Elasticsearch batch variants, and the timeout
+# of each of those requests
+ES_MSEARCH_CHUNK_SIZE = int(os.getenv("ES_MSEARCH_CHUNK_SIZE", 100))
+ES_MSEARCH_TIMEOUT = float(os.getenv("ES_MSEARCH_TIMEOUT", 60))
+
+# Bump after re-indexing Elasticsearch or Qdrant to invalidate answers cached
+# against the old index (MinSearch also versions itself by its content hash)
+INDEX_VERSION = os.getenv("INDEX_VERSION", "1")
+
+# Backends offered by this deployment. Nothing is imported or connected until a
+# backend is first used, so e.g. SEARCH_BACKENDS=MinSearch never loads torch.
+SEARCH_BACKENDS = [
+    backend.strip()
+    for backend in os.getenv(
+        "SEARCH_BACKENDS", "Qdrant,Elasticsearch_Text,Elasticsearch_Vector,MinSearch"
+    ).split(",")
+    if backend.strip()
+]
+
+
+# A resource that failed to build is not retried for this many seconds, so a missing
+# dependency does not cost a failed import on every request
+RESOURCE_RETRY_AFTER = float(os.getenv("RESOURCE_RETRY_AFTER", 300))
+
+
+# ---------------------------
+# Lazily built, process-wide resources
+# ---------------------------
+_resources = {}
+_resource_locks = {}
+_resource_failures = {}  # name -> (monotonic time of the failure, exception)
+_resources_lock = threading.Lock()
+
+# name -> {"seconds": build time, "rss_mb": resident memory added while building}
+load_report = {}
+
+
+def _rss_mb():
+    """Current resident set size in MB, or None if it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def shared(name, factory):
+    """Build `factory()` once per process and cache it under `name`.
+
+    Concurrent first callers wait for the same build; the build time and memory
+    growth are recorded in `load_report`. A failed build re-raises its error
+    without retrying for RESOURCE_RETRY_AFTER seconds.
+    """
+    resource = _resources.get(name)
+    if resource is not None:
+        return resource
+
+    with _resources_lock:
+        lock = _resource_locks.setdefault(name, threading.Lock())
+    with lock:
+        if name not in _resources:
+            failure = _resource_failures.get(name)
+            if failure is not None and time.monotonic() - failure[0] < RESOURCE_RETRY_AFTER:
+                raise failure[1]
+            rss_before = _rss_mb()
+            start_time = time.perf_counter()
+            try:
+                _resources[name] = factory()
+            except Exception as e:
+                _resource_failures[name] = (time.monotonic(), e)
+                raise
+            _resource_failures.pop(name, None)
+            rss_after = _rss_mb()
+            load_report[name] = {
+                "seconds": round(time.perf_counter() - start_time, 3),
+                "rss_mb": round(rss_after - rss_before, 1) if rss_before is not None else None,
+            }
+            print(f"Loaded {name} in {load_report[name]['seconds']:.2f}s "
+                  f"(+{load_report[name]['rss_mb']} MB RSS)")
+        return _resources[name]
+
+
+def get_es_client():
+    def connect():
+        from elasticsearch import Elasticsearch
+        return Elasticsearch(ELASTIC_URL)
+    return shared("elasticsearch", connect)
+
+
+# Backends that embed queries with get_query_encoder()
+QUERY_ENCODER_BACKENDS = ("Elasticsearch_Vector",)
+
+
+def get_query_encoder():
+    """SentenceTransformer wrapped in the shared LRU/micro-batching QueryEncoder."""
+    def load():
+        from sentence_transformers import SentenceTransformer
+        from query_encoder import QueryEncoder
+        return QueryEncoder(SentenceTransformer(QUERY_MODEL_NAME))
+    return shared("query_encoder", load)
+
+
+def get_qdrant_client():
+    def connect():
+        from qdrant_client import QdrantClient
+        # The per-search timeout only reaches the server, and this client only serves
+        # single searches, so it also keeps the short HTTP timeout (whole seconds)
+        return QdrantClient(url=QDRANT_URL, timeout=max(1, int(SEARCH_TIMEOUT)))
+    return shared("qdrant", connect)
+
+
+# ---------------------------
+# Retrievers
+# ---------------------------
+class Retriever:
+    """A search backend: returns up to `limit` documents (dicts) for a query in a city."""
+
+    def search(self, query, city, limit=5, timeout=None):
+        """`timeout` bounds this one search in seconds (None: the client default)."""
+        raise NotImplementedError
+
+    def search_batch(self, requests, limit=5):
+        """Results for many (query, city) or (query, city, vector) requests, in order."""
+        return [self.search(request[0], request[1], limit) for request in requests]
+
+    def index_version(self):
+        """Identifies the indexed content; cached answers are tied to it."""
+        return INDEX_VERSION
+
+
+def _with_timeout(es_client, timeout):
+    return es_client.options(request_timeout=timeout) if timeout else es_client
+
+
+def _msearch(es_client, index_name, bodies, chunk_size=ES_MSEARCH_CHUNK_SIZE, timeout=ES_MSEARCH_TIMEOUT):
+    """Run search bodies through _msearch, `chunk_size` per request; returns the hit sources in order."""
+    es_client = _with_timeout(es_client, timeout)
+    results = []
+    for start in range(0, len(bodies), chunk_size):
+        searches = []
+        for body in bodies[start:start + chunk_size]:
+            searches.extend([{"index": index_name}, body])
+        response = es_client.msearch(searches=searches)
+        for offset, item in enumerate(response["responses"]):
+            if "error" in item:
+                raise RuntimeError(f"Search {start + offset} of the batch failed: {item['error']}")
+            results.append([hit['_source'] for hit in item['hits']['hits']])
+    return results
+
+
+class ElasticsearchTextRetriever(Retriever):
+    def __init__(self, es_client, index_name=ES_INDEX_NAME):
+        self.es_client = es_client
+        self.index_name = index_name
+
+    def search(self, query, city, limit=5, timeout=None):
+        response = _with_timeout(self.es_client, timeout).search(
+            index=self.index_name, body=self.build_query(query, city, limit))
+        return [hit['_source'] for hit in response['hits']['hits']]
+
+    def search_batch(self, requests, limit=5, chunk_size=ES_MSEARCH_CHUNK_SIZE):
+        """Like search() for each (query, city) request, in `chunk_size` _msearch round trips."""
+        bodies = [self.build_query(request[0], request[1], limit) for request in requests]
+        return _msearch(self.es_client, self.index_name, bodies, chunk_size)
+
+    def build_query(self, query, city, limit=5):
+        search_query = {
+            "size": limit,
+            "query": {
+                "bool": {
+                    "must": [
+                        {
+                            "multi_match": {
+                                "query": query,
+                                "fields": ['city', 'section', 'subsection', 'text'],
+                                "type": "best_fields"
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+
+        # Add filter
+        if city:
+            search_query["query"]["bool"]["filter"] = {
+                "term": {
+                    "city": city
+                }
+            }
+        return search_query
+
+
+class ElasticsearchVectorRetriever(Retriever):
+    """Hybrid kNN + keyword search on the `all_data_vector` field.
+
+    The kNN part returns `k` neighbours (at least `limit`) out of `num_candidates`
+    explored per shard; see prep.ES_ANN_PROFILES.
+    """
+
+    def __init__(self, es_client, query_encoder, field="all_data_vector", index_name=ES_INDEX_NAME,
+                 k=None, num_candidates=10000):
+        self.es_client = es_client
+        self.query_encoder = query_encoder
+        self.field = field
+        self.index_name = index_name
+        self.k = k
+        self.num_candidates = num_candidates
+
+    def search(self, query, city, limit=5, timeout=None):
+        vector = self.query_encoder.encode(query)
+        search_query = self.build_query(query, city, vector, limit)
+        es_results = _with_timeout(self.es_client, timeout).search(index=self.index_name, body=search_query)
+        return [hit['_source'] for hit in es_results['hits']['hits']]
+
+    def search_batch(self, requests, limit=5, chunk_size=ES_MSEARCH_CHUNK_SIZE):
+        """Like search() for each (query, city[, vector]) request, in `chunk_size` _msearch round trips.
+
+        Missing vectors are encoded together through the shared query encoder.
+        """
+        vectors = [request[2] if len(request) > 2 else None for request in requests]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            encoded = self.query_encoder.encode_batch([requests[i][0] for i in missing])
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+
+        bodies = [self.build_query(request[0], request[1], vector, limit)
+                  for request, vector in zip(requests, vectors)]
+        return _msearch(self.es_client, self.index_name, bodies, chunk_size)
+
+    def build_query(self, query, city, vector, limit=5):
+        k = max(self.k or limit, limit)
+
+        knn_query = {
+            "field": self.field,
+            "query_vector": vector,
+            "k": k,
+            "num_candidates": max(self.num_candidates, k),
+            "boost": 0.5,
+            "filter": {
+                "term": {
+                    "city": city
+                }
+            }
+        }
+
+        keyword_query = {
+            "bool": {
+                "must": {
+                    "multi_match": {
+                        "query": query,
+                        "fields": ["city^3", 'section', 'subsection', 'text'],
+                        "type": "best_fields",
+                        "boost": 0.5,
+                    }
+                },
+                "filter": {
+                    "term": {
+                        "city": city
+                    }
+                }
+            }
+        }
+
+        return {
+            "knn": knn_query,
+            "query": keyword_query,
+            "size": limit,
+            "_source": ["city", 'section', 'subsection', 'text', "id"]
+        }
+
+
+class MinSearchRetriever(Retriever):
+    boost = {'text': 3.0, 'section': 0.5}
+
+    def __init__(self, index):
+        self.index = index
+
+    def search(self, query, city, limit=5, timeout=None):
+        return self.index.search(
+            query=query,
+            filter_dict={'city': city},
+            boost_dict=self.boost,
+            num_results=limit,
+        )
+
+    def search_batch(self, requests, limit=5):
+        return self.index.search_batch(
+            [request[0] for request in requests],
+            filter_dicts=[{'city': request[1]} for request in requests],
+            boost_dict=self.boost,
+            num_results=limit,
+        )
+
+    def index_version(self):
+        return f"{INDEX_VERSION}:{self.index.content_hash}"
+
+
+class QdrantRetriever(Retriever):
+    """Dense (MODEL_HANDLE) + BM25 prefetch fused with RRF, filtered by city.
+
+    `search_params` (see qdrant.search_params) tunes the dense prefetch, e.g. the
+    HNSW beam and quantization rescoring of a collection profile.
+    """
+
+    def __init__(self, client, collection_name=QDRANT_COLLECTION_NAME, model_handle=MODEL_HANDLE,
+                 search_params=None):
+        self.client = client
+        self.collection_name = collection_name
+        self.model_handle = model_handle
+        self.search_params = search_params
+
+    def search(self, query, city, limit=5, timeout=None):
+        from qdrant_client import models
+
+        results = self.client.query_points(
+            collection_name=self.collection_name,
+            prefetch=[
+                models.Prefetch(
+                    query=models.Document(
+                        text=query,
+                        model=self.model_handle,
+                    ),
+                    using="jina-small",
+                    params=self.search_params,
+                    limit=(5 * limit),
+                ),
+                models.Prefetch(
+                    query=models.Document(
+                        text=query,
+                        model="Qdrant/bm25",
+                    ),
+                    using="bm25",
+                    limit=(5 * limit),
+                ),
+            ],
+            query_filter=models.Filter(
+                must=[
+                    models.FieldCondition(
+                        key="city",
+                        match=models.MatchValue(value=city)
+                    )
+                ]
+            ),
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            with_payload=True,
+            limit=limit,  # final number of results returned
+            timeout=max(1, int(timeout)) if timeout else None,  # Qdrant takes whole seconds
+        )
+
+        return [point.payload for point in results.points]
+
+
+# ---------------------------
+# Registry
+# ---------------------------
+RETRIEVER_FACTORIES = {}
+
+
+def register_retriever(name):
+    """Register a zero-argument factory that builds the retriever for `name`."""
+    def decorator(factory):
+        RETRIEVER_FACTORIES[name] = factory
+        return factory
+    return decorator
+
+
+@register_retriever("Elasticsearch_Text")
+def _elasticsearch_text():
+    return ElasticsearchTextRetriever(get_es_client())
+
+
+@register_retriever("Elasticsearch_Vector")
+def _elasticsearch_vector():
+    from prep import get_es_profile
+    profile = get_es_profile()
+    return ElasticsearchVectorRetriever(get_es_client(), get_query_encoder(),
+                                        k=profile["k"], num_candidates=profile["num_candidates"])
+
+
+@register_retriever("MinSearch")
+def _minsearch():
+    from minsearch_client import build_minsearch_index
+    return MinSearchRetriever(build_minsearch_index())
+
+
+@register_retriever("Qdrant")
+def _qdrant():
+    from qdrant_profiles import search_params
+    return QdrantRetriever(get_qdrant_client(), search_params=search_params())
+
+
+def available_retrievers():
+    """Enabled backends (SEARCH_BACKENDS) that have a registered factory."""
+    return [name for name in SEARCH_BACKENDS if name in RETRIEVER_FACTORIES]
+
+
+def get_retriever(name):
+    """Return the retriever for `name`, building it on first use."""
+    if name not in available_retrievers():
+        raise ValueError(f"Unknown or disabled search type: {name}. Available: {available_retrievers()}")
+    return shared(f"retriever:{name}", RETRIEVER_FACTORIES[name])
+
+
+def index_version(name):
+    """`get_retriever(name).index_version()` without building the retriever.
+
+    Cached answers are looked up by it, so a cache hit does not load any backend.
+    Until MinSearch is built, its version comes from the content hash of its snapshot.
+    """
+    retriever = _resources.get(f"retriever:{name}")
+    if retriever is not None:
+        return retriever.index_version()
+    if name == "MinSearch":
+        import minsearch
+        from minsearch_client import MINSEARCH_INDEX_PATH
+        return f"{INDEX_VERSION}:{minsearch.Index.read_content_hash(MINSEARCH_INDEX_PATH)}"
+    return INDEX_VERSION
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Load retrievers and report their startup cost")
+    parser.add_argument("backends", nargs="*", help="defaults to every enabled backend")
+    parser.add_argument("--city", default="Cairo")
+    parser.add_argument("--query", default="What should I eat?",
+                        help="run one search per backend after loading it")
+    args = parser.parse_args()
+
+    for name in args.backends or available_retrievers():
+        try:
+            retriever = get_retriever(name)
+            start_time = time.perf_counter()
+            retriever.search(args.query, args.city)
+            load_report[f"retriever:{name}"]["first_search_seconds"] = \
+                round(time.perf_counter() - start_time, 3)
+        except Exception as e:
+            print(f"{name} failed: {e}")
+
+    load_report["process"] = {
+        "rss_mb": round(_rss_mb(), 1) if _rss_mb() is not None else None,
+        "torch_loaded": "torch" in sys.modules,
+    }
+    print(json.dumps(load_report, indent=2))
@@ -0,0 +1,71 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    from prometheus_client import Histogram, start_http_server
+except ImportError:  # optional: spans are still stored in Postgres
+    Histogram = None
+
+
+# Port for the Prometheus /metrics endpoint (0 disables it)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+stage_seconds = Histogram(
+    "musafir_stage_duration_seconds",
+    "Duration of each stage of answering a question",
+    ["stage", "backend"],
+    buckets=STAGE_BUCKETS,
+) if Histogram is not None else None
+
+_server_lock = threading.Lock()
+_server_started = False
+
+
+def observe(stage, seconds, backend=None):
+    if stage_seconds is not None:
+        stage_seconds.labels(stage=stage, backend=backend or "").observe(seconds)
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve the histograms on `port` once per process. Returns True if serving."""
+    global _server_started
+    if stage_seconds is None or not port:
+        return False
+    with _server_lock:
+        if not _server_started:
+            try:
+                start_http_server(port)
+                _server_started = True
+                print(f"Prometheus metrics on :{port}/metrics")
+            except OSError as e:  # e.g. another process already owns the port
+                print(f"Could not start metrics server on :{port}: {e}")
+    return _server_started
+
+
+class Trace:
+    """
+    Per-request list of timed spans ({stage, backend, duration_ms}).
+
+    Every span is also observed in the process-wide Prometheus histogram. Spans can
+    be added from several threads (e.g. the ensemble retrieval workers).
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, backend=None):
+        with self._lock:
+            self.spans.append({"stage": stage, "backend": backend, "duration_ms": seconds * 1000})
+        observe(stage, seconds, backend)
+
+    @contextmanager
+    def span(self, stage, backend=None):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start_time, backend)